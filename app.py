@@ -1,58 +1,129 @@
 # dash_sales_customer_dashboard_final.py
 # Usage: python dash_sales_customer_dashboard_final.py
 
+import hashlib
+import hmac
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from dash import Dash, html, dcc, Input, Output, State
+from datetime import date, datetime
+from dash import Dash, DiskcacheManager, dash_table, html, dcc, Input, Output, Patch, State, no_update
+from dash.dash_table.Format import Format, Group, Scheme
+from flask import Response, jsonify, request
+from urllib.parse import urlencode
 import plotly.express as px
 import plotly.graph_objects as go
-df = pd.read_csv("./data/ecommerce_synthetic_dataset.csv") # uploaded dataset
-print(df.head)
-# Quick preprocessing
-df.columns = [c.strip() for c in df.columns]
-
-# Parse dates (handle dd-mm-YYYY safely)
-for date_col in ['PurchaseDate', 'SignUpDate']:
-    if date_col in df.columns:
-        df[date_col] = pd.to_datetime(df[date_col], errors='coerce', dayfirst=True)
-
-# Ensure numeric fields
-if 'Quantity' not in df.columns:
-    df['Quantity'] = 1
-if 'Price' not in df.columns:
-    df['Price'] = 0.0
-if 'TotalAmount' not in df.columns:
+from plotly.io.json import to_json_plotly
+import metrics
+from backends import PandasBackend, SQLBackend, backend_for_path
+from engine import Dataset
+from preprocess import DEFAULT_CSV, clean_frame, frame_mb, iso_text, load_dataset
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+DATA_PATH = os.environ.get('DATA_PATH', DEFAULT_CSV)
+# pandas (in memory; the default for a CSV), duckdb (Parquet files or a .duckdb
+# database) or sqlite (.db file); see backends.py
+DATA_BACKEND = os.environ.get('DATA_BACKEND') or backend_for_path(DATA_PATH)
+# Unique Customers: exact (default) or approx, which estimates from HyperLogLog
+# sketches (HLL_PRECISION 12 ~ 1.6% standard error) with an "exact" toggle on
+# the KPI card for when the precise number is wanted. The SQL backends always
+# count exactly.
+APPROX_CUSTOMERS = os.environ.get('UNIQUE_CUSTOMERS', 'exact') == 'approx' and DATA_BACKEND == 'pandas'
+HLL_PRECISION = int(os.environ.get('HLL_PRECISION', '12'))
+
+# Incremental ingestion: CSV batches dropped into INGEST_DIR (directly, or via
+# POST /ingest) are cleaned on their own and appended to the dataset. Files are
+# left in place so every worker process picks up every batch; each process
+# remembers which files it has already ingested.
+INGEST_DIR = os.environ.get('INGEST_DIR', os.path.join(os.path.dirname(DATA_PATH), 'incoming'))
+INGEST_POLL_SECONDS = float(os.environ.get('INGEST_POLL_SECONDS', '60'))
+INGEST_TOKEN = os.environ.get('INGEST_TOKEN')
+_ingested_files = set()
+_ingest_lock = threading.Lock()
+
+def read_pending_batches():
+    # Returns (file names, cleaned batch or None) for the CSVs not ingested yet
     try:
-        df['Price'] = pd.to_numeric(df['Price'], errors='coerce').fillna(0.0)
-        df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce').fillna(1)
-    except Exception:
-        pass
-    df['TotalAmount'] = df['Price'] * df['Quantity']
+        names = sorted(n for n in os.listdir(INGEST_DIR) if n.endswith('.csv') and n not in _ingested_files)
+    except FileNotFoundError:
+        return [], None
+    frames = []
+    for name in names:
+        try:
+            frames.append(pd.read_csv(os.path.join(INGEST_DIR, name)))
+        except Exception as e:
+            print(f'Skipping ingest file {name}: {e}')
+    if not frames:
+        return names, None
+    return names, clean_frame(pd.concat(frames, ignore_index=True))
 
-# Fill categorical missing values
-for c in ['Category', 'Country', 'Gender', 'ProductName', 'DeviceType', 'ReferralSource', 'UserName']:
-    if c in df.columns:
-        df[c] = df[c].fillna('Unknown')
+def load_pandas_backend(path):
+    df = load_dataset(path)  # memory-mapped snapshot, or the uploaded CSV when the snapshot is stale
+    print(df.head)
+    print(f'Dataset: {len(df):,} rows, {frame_mb(df):,.1f} MB')
+    # Index Country/Category over the PurchaseDate-sorted rows once (filters then
+    # return views) and build the monthly rollups that answer the aggregate charts.
+    dataset = Dataset.from_frame(df, sketch_precision=HLL_PRECISION if APPROX_CUSTOMERS else None)
+    # Batches dropped since the snapshot was built are appended in one go
+    names, batch = read_pending_batches()
+    if batch is not None and len(batch):
+        dataset = dataset.append(batch)
+    _ingested_files.update(names)
+    return PandasBackend(dataset)
 
-# Add Date and Month fields (use parsed PurchaseDate)
-if 'PurchaseDate' in df.columns and not df['PurchaseDate'].isna().all():
-    df['Date'] = pd.to_datetime(df['PurchaseDate'], dayfirst=True, errors='coerce').dt.date
-    df['Month'] = pd.to_datetime(df['PurchaseDate'], dayfirst=True, errors='coerce').dt.to_period('M').dt.to_timestamp()
+# Ingested batches replace `backend` as a whole; see ingest_pending()
+if DATA_BACKEND == 'pandas':
+    backend = load_pandas_backend(DATA_PATH)
 else:
-    today_ts = pd.to_datetime('today')
-    df['Date'] = today_ts.date()
-    df['Month'] = today_ts.to_period('M').to_timestamp()
-
-# Ensure UserID exists
+    backend = SQLBackend(DATA_PATH, DATA_BACKEND)
 
-if 'UserID' not in df.columns and 'UserName' in df.columns:
-    df['UserID'] = df['UserName'].astype(str)
-elif 'UserID' not in df.columns:
-    # fallback: create synthetic user ids
-    df['UserID'] = df.index.astype(str)
+# Background charts: the map, sunburst and session scatter are computed by a
+# Dash background callback in a child process (DiskcacheManager: jobs and
+# results go through a local diskcache, no broker), so a slow one never holds
+# a request thread. Without the dash[diskcache] extras, or with
+# BACKGROUND_CALLBACKS=0, they run in the request like the other charts.
+BACKGROUND_CALLBACKS = os.environ.get('BACKGROUND_CALLBACKS', '1') != '0'
+BACKGROUND_CACHE_DIR = os.environ.get('BACKGROUND_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'sales-dashboard-jobs'))
+background_manager = None
+if BACKGROUND_CALLBACKS:
+    try:
+        import diskcache
+        background_cache = diskcache.Cache(BACKGROUND_CACHE_DIR)
+        background_manager = DiskcacheManager(background_cache, expire=600)
+        background_cache.close()  # reopened lazily per process, never carried across the gunicorn fork
+    except ImportError:
+        print('dash[diskcache] is not installed; heavy charts render in the request')
 
-app = Dash(__name__, title='Sales & Customer Dashboard — Colorful (fixed)')
+app = Dash(__name__, title='Sales & Customer Dashboard — Colorful (fixed)', background_callback_manager=background_manager)
 server = app.server
+metrics.install(server)
+
+# Readiness probe for the process manager / load balancer. The dataset, index
+# and rollups (or the SQL connection) are set up while this module imports, so a
+# worker that can answer is ready unless the dataset came up empty.
+@server.route('/ready')
+def ready():
+    b = backend
+    rows = b.rows()
+    return jsonify(status='ready' if rows else 'empty', backend=b.name, rows=rows, version=b.version,
+                   pid=os.getpid()), 200 if rows else 503
+
+# Prometheus scrape target; see metrics.py for the series and PROFILE_SLOW_MS
+@server.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 # Inject CSS into the page head via app.index_string
 CUSTOM_CSS = """
@@ -116,340 +187,1249 @@ MAIN_CHART_HEIGHT = '420px'
 SIDE_CHART_HEIGHT = '340px'
 SMALL_CHART_HEIGHT = '280px'
 
-country_options = [{'label': c, 'value': c} for c in sorted(df['Country'].unique())] if 'Country' in df.columns else []
-category_options = [{'label': c, 'value': c} for c in sorted(df['Category'].unique())] if 'Category' in df.columns else []
+def dropdown_options(b, col):
+    return [{'label': c, 'value': c} for c in b.values(col)]
 
-app.layout = html.Div([
-    # Top header (badges removed)
-    html.Div([
-        html.Div([
-            html.H2('📊 Sales & Customer Dashboard', style={'margin': 0, 'fontWeight': 700}),
-            html.Div('Dashboard for e-commerce dataset', style={'opacity': 0.9})
-        ])
-    ], style=HEADER_STYLE),
-
-    # Main container
-    html.Div([
-        # LEFT SIDEBAR
-        html.Div([
-            html.Div('Filters', style={'fontSize': 16, 'fontWeight': 700, 'marginBottom': 12}),
-            html.Div([
-                html.Label('Country', className='sidebar-label'),
-                dcc.Dropdown(id='country-filter', options=country_options, value=[], multi=True, placeholder='All countries')
-            ], style={'marginBottom': 10}),
+# Orders table: the columns it shows and their DataTable types
+TABLE_COLUMNS = [
+    ('PurchaseDate', 'datetime'), ('UserID', 'text'), ('Country', 'text'), ('Category', 'text'),
+    ('ProductName', 'text'), ('Price', 'numeric'), ('Quantity', 'numeric'), ('TotalAmount', 'numeric'),
+    ('DeviceType', 'text'), ('ReferralSource', 'text'),
+]
+TABLE_PAGE_SIZE = int(os.environ.get('TABLE_PAGE_SIZE', '100'))
+MONEY_FORMAT = Format(precision=2, scheme=Scheme.fixed, group=Group.yes)
 
-            html.Div([
-                html.Label('Category', className='sidebar-label'),
-                dcc.Dropdown(id='category-filter', options=category_options, value=[], multi=True, placeholder='All categories')
-            ], style={'marginBottom': 10}),
-            html.Div([
-                html.Label('Date Range', className='sidebar-label'),
-                dcc.DatePickerRange(
-                    id='date-range',
-                    start_date=df['Date'].min() if 'Date' in df.columns else None,
-                    end_date=df['Date'].max() if 'Date' in df.columns else None,
-                    display_format='YYYY-MM-DD',
-                    style={'width':'100%'}
-                )
-            ], style={'marginBottom': 12}),
+def table_columns(b):
+    return [{'name': c, 'id': c, 'type': t, **({'format': MONEY_FORMAT} if c in ('Price', 'TotalAmount') else {})}
+            for c, t in TABLE_COLUMNS if c in b.columns]
 
-            html.Div([
-                html.Button('Download CSV', id='btn-download', style={
-                    'width':'100%', 'padding':'10px 12px', 'borderRadius':'10px', 'border':'none',
-                    'background': 'linear-gradient(90deg, #ff7a59, #ff9a76)', 'color':'white', 'fontWeight':700, 'cursor':'pointer'
-                }),
-                dcc.Download(id='download-csv')
-            ], style={'marginBottom': 14}),
+# Partial updates: callbacks keep a digest of what each output last showed in
+# a browser-side store and re-send only what changed (see update_dashboard)
+def content_digest(*parts):
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            h.update(repr(list(part.columns)).encode())
+            h.update(pd.util.hash_pandas_object(part, index=False).values.tobytes())
+        elif isinstance(part, np.ndarray):
+            h.update(repr((part.dtype, part.shape)).encode())
+            h.update(np.ascontiguousarray(part).tobytes())
+        else:
+            h.update(repr(part).encode())
+    return h.hexdigest()
+
+# Serialized figures, keyed on the output name and the digest of what it
+# plots, so every visitor of the same view (above all the default one) gets
+# the JSON built once instead of re-running plotly express. Bounded by entry
+# count and bytes; the least used entry goes first, and uses are halved after
+# a data reload so stale favourites age out (see warm_figures). Entries are
+# never dropped on a reload, so the inputs passed to render_output must be the
+# data the figure is built from, never just the filter state: then new data
+# means a new key rather than a stale hit.
+FIGURE_CACHE_MAX_ENTRIES = int(os.environ.get('FIGURE_CACHE_MAX_ENTRIES', '256'))
+FIGURE_CACHE_MAX_MB = float(os.environ.get('FIGURE_CACHE_MAX_MB', '64'))
+
+class FigureCache:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # key -> [json text, layout digest, uses]
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None  # counted as a miss by put(), as text outputs are looked up too
+            entry[2] += 1
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key, text, layout_key):
+        nbytes = len(text)
+        with self._lock:
+            self.misses += 1
+            if nbytes > self.max_bytes or self.max_entries <= 0:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            while self._entries and (len(self._entries) >= self.max_entries or self._bytes + nbytes > self.max_bytes):
+                # fewest uses; ties go to the oldest entry (dicts keep insertion order)
+                victim = min(self._entries, key=lambda k: self._entries[k][2])
+                self._bytes -= len(self._entries.pop(victim)[0])
+            self._entries[key] = [text, layout_key, old[2] if old else 1]
+            self._bytes += nbytes
+
+    def decay(self):
+        with self._lock:
+            for entry in self._entries.values():
+                entry[2] //= 2
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def after_fork(self):
+        self._lock = threading.Lock()  # may have been held by another thread at fork time
+
+figure_cache = FigureCache(FIGURE_CACHE_MAX_ENTRIES, int(FIGURE_CACHE_MAX_MB * 1024 * 1024))
 
+def render_output(name, digests, inputs, build):
+    # Returns no_update, a Patch of the figure's traces, or the full output
+    key = content_digest(*inputs)
+    previous = digests.get(name)
+    if previous and previous[0] == key:
+        return no_update
+    with metrics.stage('figure'):
+        hit = figure_cache.get((name, key))
+        if hit is None:
+            out = build()
+            if not isinstance(out, go.Figure):
+                digests[name] = [key, None]
+                return out
+            text = to_json_plotly(out)
+            layout_key = content_digest(to_json_plotly(out.to_plotly_json()['layout']))
+            figure_cache.put((name, key), text, layout_key)
+        else:
+            text, layout_key = hit
+        fig = json.loads(text)
+    digests[name] = [key, layout_key]
+    if previous and previous[1] == layout_key:
+        patch = Patch()
+        patch['data'] = fig['data']
+        return patch
+    return fig
+
+def options_digests(b, country_opts, category_opts):
+    # Initial 'data-version' store: the version plus digests of the filter options
+    digests = {'version': b.version}
+    for name, opts in (('country_options', country_opts), ('category_options', category_opts)):
+        render_output(name, digests, [opts], lambda: opts)
+    return digests
+
+# What a page starts from: the filter options, the date span (the warmed
+# default view) and the 'data-version' store, worked out once per version of
+# the data rather than on every page load
+_layout_data = None
+
+def layout_data():
+    global _layout_data
+    b = backend
+    data = _layout_data
+    if data is None or data[0] != b.version:
+        countries, categories = dropdown_options(b, 'Country'), dropdown_options(b, 'Category')
+        data = _layout_data = (b.version, countries, categories, b.date_span(), options_digests(b, countries, categories))
+    return data
+
+def serve_layout():
+    # Built per page load, so a page opened after an ingest starts from the
+    # current data; see layout_data()
+    b = backend
+    _, country_options, category_options, (first_date, last_date), version_digests = layout_data()
+
+    return html.Div([
+        # Top header (badges removed)
+        html.Div([
             html.Div([
-                html.Div('Quick actions', style={'fontWeight':700, 'marginBottom':8}),
-                html.Button('Export PNG (all)', id='btn-export-png', style={'width':'100%','padding':'8px','borderRadius':'8px','border':'1px solid rgba(0,0,0,0.06)','background':'white','cursor':'pointer'})
-            ], style={'marginBottom': 18}),
-
-            html.Hr(),
-             html.Div([
-                html.Div('Tips', style={'fontWeight':700, 'marginBottom':8}),
-                html.Div('• Use filters to narrow down data.\n• Click Download to export the filtered dataset.\n• Hover charts to see details.', style={'whiteSpace':'pre-line', 'color':'#333', 'opacity':0.85})
-            ], style={'fontSize':13, 'lineHeight':'1.4'}),
-
-            html.Div(style={'height':'32px'})
-        ],
-        style={
-            'width': '320px',
-            'minWidth': '280px',
-            'padding': '18px',
-            'boxSizing': 'border-box',
-            'borderRadius': '12px',
-            'background': 'linear-gradient(180deg, #ffffff, #fcfdff)',
-            'boxShadow': '0 8px 30px rgba(33,47,97,0.04)',
-            'position': 'sticky',
-            'top': '26px',
-            'height': 'calc(100vh - 120px)',
-            'overflowY': 'auto'
-        }),
-         # RIGHT MAIN
+                html.H2('📊 Sales & Customer Dashboard', style={'margin': 0, 'fontWeight': 700}),
+                html.Div('Dashboard for e-commerce dataset', style={'opacity': 0.9})
+            ])
+        ], style=HEADER_STYLE),
+
+        # Main container
         html.Div([
-            # KPI row (colorful)
+            # LEFT SIDEBAR
             html.Div([
+                html.Div('Filters', style={'fontSize': 16, 'fontWeight': 700, 'marginBottom': 12}),
                 html.Div([
-                    html.Div(style={'display':'flex','justifyContent':'space-between','alignItems':'center'}, children=[
-                        html.Div('Total Revenue', className='kpi-sub'),
-                        html.Div('🔥', style={'fontSize':18})
-                    ]),
-                    html.H3(id='kpi-revenue', className='kpi-value', style={'marginTop':6}),
-                    dcc.Graph(id='sparkline-revenue', config={'displayModeBar': False}, style={'height':'70px', 'marginTop':6})
-                ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#fff8f2, #fff6f9)'}),
+                    html.Label('Country', className='sidebar-label'),
+                    dcc.Dropdown(id='country-filter', options=country_options, value=[], multi=True, placeholder='All countries')
+                ], style={'marginBottom': 10}),
 
                 html.Div([
-                    html.Div('Total Orders', className='kpi-sub'),
-                    html.H3(id='kpi-orders', className='kpi-value', style={'marginTop':6}),
-                ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#f6fbff,#f0f9ff)'}),
+                    html.Label('Category', className='sidebar-label'),
+                    dcc.Dropdown(id='category-filter', options=category_options, value=[], multi=True, placeholder='All categories')
+                ], style={'marginBottom': 10}),
+                html.Div([
+                    html.Label('Date Range', className='sidebar-label'),
+                    dcc.DatePickerRange(
+                        id='date-range',
+                        start_date=first_date,
+                        end_date=last_date,
+                        min_date_allowed=first_date,
+                        max_date_allowed=last_date,
+                        display_format='YYYY-MM-DD',
+                        style={'width':'100%'}
+                    )
+                ], style={'marginBottom': 12}),
 
                 html.Div([
-                    html.Div('Unique Customers', className='kpi-sub'),
-                    html.H3(id='kpi-customers', className='kpi-value', style={'marginTop':6}),
-                ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#f9fff6,#f0fff0)'}),
+                    html.A(html.Button('Download CSV', id='btn-download', style={
+                        'width':'100%', 'padding':'10px 12px', 'borderRadius':'10px', 'border':'none',
+                        'background': 'linear-gradient(90deg, #ff7a59, #ff9a76)', 'color':'white', 'fontWeight':700, 'cursor':'pointer'
+                    }), id='download-link', href=app.get_relative_path('/export'), download='filtered_sales.csv.gz'),
+                    html.A('or download as Parquet', id='download-parquet-link', href=app.get_relative_path('/export?format=parquet'),
+                           download='filtered_sales.parquet', className='small-muted',
+                           style={'display': 'block' if pq is not None else 'none', 'textAlign':'center', 'marginTop':6})
+                ], style={'marginBottom': 14}),
 
                 html.Div([
-                    html.Div('Avg Order Value', className='kpi-sub'),
-                    html.H3(id='kpi-aov', className='kpi-value', style={'marginTop':6}),
-                ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#fff8ff,#fff0ff)'}),
-            ], style={'display':'grid', 'gridTemplateColumns':'repeat(auto-fit, minmax(180px, 1fr))', 'gap':'12px', 'marginBottom':20}),
-            
-            # Sales Over Time
-            html.Div([
-                html.Div('Sales Over Time', style={'fontWeight':700, 'marginBottom':8, 'color':'#123'}),
-                dcc.Graph(id='sales-time-series', config={'displayModeBar': False}, style={'height': MAIN_CHART_HEIGHT})
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':18}),
+                    html.Div('Quick actions', style={'fontWeight':700, 'marginBottom':8}),
+                    html.Button('Export PNG (all)', id='btn-export-png', style={'width':'100%','padding':'8px','borderRadius':'8px','border':'1px solid rgba(0,0,0,0.06)','background':'white','cursor':'pointer'})
+                ], style={'marginBottom': 18}),
 
-            # World map
-            html.Div([
-                html.Div('Global Sales (by Country)', style={'fontWeight':700, 'marginBottom':8, 'color':'#123'}),
-                dcc.Graph(id='sales-world-map', config={'displayModeBar': False}, style={'height': MAIN_CHART_HEIGHT})
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':18}),
+                html.Hr(),
+                 html.Div([
+                    html.Div('Tips', style={'fontWeight':700, 'marginBottom':8}),
+                    html.Div('• Use filters to narrow down data.\n• Click Download to export the filtered dataset (gzip-compressed CSV).\n• Hover charts to see details.', style={'whiteSpace':'pre-line', 'color':'#333', 'opacity':0.85})
+                ], style={'fontSize':13, 'lineHeight':'1.4'}),
 
-            # Category + Top products stacked
+                html.Div(style={'height':'32px'})
+            ],
+            style={
+                'width': '320px',
+                'minWidth': '280px',
+                'padding': '18px',
+                'boxSizing': 'border-box',
+                'borderRadius': '12px',
+                'background': 'linear-gradient(180deg, #ffffff, #fcfdff)',
+                'boxShadow': '0 8px 30px rgba(33,47,97,0.04)',
+                'position': 'sticky',
+                'top': '26px',
+                'height': 'calc(100vh - 120px)',
+                'overflowY': 'auto'
+            }),
+             # RIGHT MAIN
             html.Div([
-                html.Div('Revenue by Category', style={'fontWeight':700, 'marginBottom':8}),
-                dcc.Graph(id='sales-by-category', config={'displayModeBar': False}, style={'height': SIDE_CHART_HEIGHT}),
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+                # KPI row (colorful)
+                html.Div([
+                    html.Div([
+                        html.Div(style={'display':'flex','justifyContent':'space-between','alignItems':'center'}, children=[
+                            html.Div('Total Revenue', className='kpi-sub'),
+                            html.Div('🔥', style={'fontSize':18})
+                        ]),
+                        html.H3(id='kpi-revenue', className='kpi-value', style={'marginTop':6}),
+                        dcc.Graph(id='sparkline-revenue', config={'displayModeBar': False}, style={'height':'70px', 'marginTop':6})
+                    ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#fff8f2, #fff6f9)'}),
 
-            html.Div([
-                html.Div('Top Products', style={'fontWeight':700, 'marginBottom':8}),
-                dcc.Graph(id='top-products', config={'displayModeBar': False}, style={'height': SIDE_CHART_HEIGHT}),
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+                    html.Div([
+                        html.Div('Total Orders', className='kpi-sub'),
+                        html.H3(id='kpi-orders', className='kpi-value', style={'marginTop':6}),
+                    ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#f6fbff,#f0f9ff)'}),
 
-            html.Div([
-                html.Div('Category → Product (Sunburst)', style={'fontWeight':700, 'marginBottom':8}),
-                dcc.Graph(id='category-sunburst', config={'displayModeBar': False}, style={'height': SIDE_CHART_HEIGHT}),
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':18}),
+                    html.Div([
+                        html.Div(style={'display':'flex','justifyContent':'space-between','alignItems':'center'}, children=[
+                            html.Div('Unique Customers', className='kpi-sub'),
+                            dcc.Checklist(id='customers-exact', options=[{'label': ' exact', 'value': 'exact'}], value=[],
+                                          style={'fontSize':12, 'color':'#556', 'display': 'block' if APPROX_CUSTOMERS else 'none'})
+                        ]),
+                        html.H3(id='kpi-customers', className='kpi-value', style={'marginTop':6}),
+                    ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#f9fff6,#f0fff0)'}),
+
+                    html.Div([
+                        html.Div('Avg Order Value', className='kpi-sub'),
+                        html.H3(id='kpi-aov', className='kpi-value', style={'marginTop':6}),
+                    ], className='card', style={**CARD_STYLE, 'background': 'linear-gradient(90deg,#fff8ff,#fff0ff)'}),
+                ], style={'display':'grid', 'gridTemplateColumns':'repeat(auto-fit, minmax(180px, 1fr))', 'gap':'12px', 'marginBottom':20}),
             
-            # Customer charts
-            html.Div([
-                html.Div('Customers by Gender', style={'fontWeight':700, 'marginBottom':8}),
-                dcc.Graph(id='gender-pie', style={'height': SMALL_CHART_HEIGHT})
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+                # Sales Over Time
+                html.Div([
+                    html.Div('Sales Over Time', style={'fontWeight':700, 'marginBottom':8, 'color':'#123'}),
+                    dcc.Graph(id='sales-time-series', config={'displayModeBar': False}, style={'height': MAIN_CHART_HEIGHT})
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':18}),
 
-            html.Div([
-                html.Div('Referral Sources', style={'fontWeight':700, 'marginBottom':8}),
-                dcc.Graph(id='referral-bar', style={'height': SMALL_CHART_HEIGHT})
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+                # Shown while the background job for the map, sunburst and scatter runs
+                html.Div([
+                    html.Span('Updating map, sunburst and scatter… ', className='small-muted'),
+                    html.Progress(id='heavy-progress', value='0', max='3', style={'width':'160px', 'verticalAlign':'middle'})
+                ], id='heavy-status', style={'display':'none', 'marginBottom':10}),
 
-            html.Div([
-                html.Div('Session Duration vs Avg Order Value', style={'fontWeight':700, 'marginBottom':8}),
-                dcc.Graph(id='session-scatter', style={'height': SMALL_CHART_HEIGHT})
-            ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':36}),
+                # World map
+                html.Div([
+                    html.Div('Global Sales (by Country)', style={'fontWeight':700, 'marginBottom':8, 'color':'#123'}),
+                    dcc.Graph(id='sales-world-map', config={'displayModeBar': False}, style={'height': MAIN_CHART_HEIGHT})
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':18}),
+
+                # Category + Top products stacked
+                html.Div([
+                    html.Div('Revenue by Category', style={'fontWeight':700, 'marginBottom':8}),
+                    dcc.Graph(id='sales-by-category', config={'displayModeBar': False}, style={'height': SIDE_CHART_HEIGHT}),
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
 
-        ], style={'flex': '1', 'paddingLeft': '22px', 'boxSizing': 'border-box', 'minWidth': 0})
-    ], style={'display': 'flex', 'gap': '24px', 'alignItems': 'flex-start', 'paddingBottom': '40px'}),
+                html.Div([
+                    html.Div('Top Products', style={'fontWeight':700, 'marginBottom':8}),
+                    dcc.Graph(id='top-products', config={'displayModeBar': False}, style={'height': SIDE_CHART_HEIGHT}),
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+
+                html.Div([
+                    html.Div('Category → Product (Sunburst)', style={'fontWeight':700, 'marginBottom':8}),
+                    dcc.Graph(id='category-sunburst', config={'displayModeBar': False}, style={'height': SIDE_CHART_HEIGHT}),
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':18}),
+            
+                # Customer charts
+                html.Div([
+                    html.Div('Customers by Gender', style={'fontWeight':700, 'marginBottom':8}),
+                    dcc.Graph(id='gender-pie', style={'height': SMALL_CHART_HEIGHT})
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+
+                html.Div([
+                    html.Div('Referral Sources', style={'fontWeight':700, 'marginBottom':8}),
+                    dcc.Graph(id='referral-bar', style={'height': SMALL_CHART_HEIGHT})
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+
+                html.Div([
+                    html.Div('Session Duration vs Avg Order Value', style={'fontWeight':700, 'marginBottom':8}),
+                    dcc.Graph(id='session-scatter', style={'height': SMALL_CHART_HEIGHT})
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+
+                # Cohort retention: customers grouped by signup (or first purchase) month
+                html.Div([
+                    html.Div([
+                        html.Span('Customer Retention by Cohort', style={'fontWeight':700}),
+                        dcc.RadioItems(id='cohort-basis', value='signup', inline=True,
+                                       options=[{'label': ' signup month', 'value': 'signup'},
+                                                {'label': ' first purchase', 'value': 'first_purchase'}],
+                                       inputStyle={'marginLeft':10}, style={'fontSize':12, 'color':'#556'}),
+                        dcc.RadioItems(id='cohort-measure', value='retention', inline=True,
+                                       options=[{'label': ' retention %', 'value': 'retention'},
+                                                {'label': ' revenue', 'value': 'revenue'}],
+                                       inputStyle={'marginLeft':10}, style={'fontSize':12, 'color':'#556'}),
+                    ], style={'display':'flex', 'gap':'18px', 'alignItems':'center', 'flexWrap':'wrap', 'marginBottom':8}),
+                    dcc.Graph(id='cohort-heatmap', config={'displayModeBar': False}, style={'height': MAIN_CHART_HEIGHT}),
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':16}),
+
+                # Drill-down: the matching orders, one page at a time from the server
+                html.Div([
+                    html.Div([
+                        html.Span('Orders', style={'fontWeight':700}),
+                        html.Span(id='orders-count', className='small-muted', style={'marginLeft':10}),
+                    ], style={'marginBottom':8}),
+                    dash_table.DataTable(
+                        id='orders-table',
+                        columns=table_columns(b),
+                        page_action='custom', page_current=0, page_size=TABLE_PAGE_SIZE,
+                        sort_action='custom', sort_mode='multi', sort_by=[],
+                        filter_action='custom', filter_query='',
+                        virtualization=True, fixed_rows={'headers': True},
+                        style_table={'height': MAIN_CHART_HEIGHT, 'overflowY': 'auto'},
+                        style_cell={'fontFamily': 'Inter, system-ui, sans-serif', 'fontSize': 13, 'minWidth': 90},
+                        style_header={'fontWeight': 600},
+                    ),
+                ], className='card', style={**CARD_STYLE, 'padding':'18px', 'marginBottom':36}),
+
+            ], style={'flex': '1', 'paddingLeft': '22px', 'boxSizing': 'border-box', 'minWidth': 0})
+        ], style={'display': 'flex', 'gap': '24px', 'alignItems': 'flex-start', 'paddingBottom': '40px'}),
+
+        # Picks up ingested batches: refreshes the filter options and date bounds
+        dcc.Interval(id='data-refresh', interval=max(INGEST_POLL_SECONDS, 1) * 1000, disabled=INGEST_POLL_SECONDS <= 0),
+        dcc.Store(id='data-version', data=version_digests),
+        # Digests of what each dashboard output last showed; see update_dashboard()
+        dcc.Store(id='figure-digests', data={}),
+        dcc.Store(id='heavy-digests', data={}),
+        dcc.Store(id='cohort-digests', data={}),
+        dcc.Store(id='orders-view', data=None),  # the view the orders table is paging through
+    ], style={'padding': '22px'})
+
+app.layout = serve_layout
+def parse_filter_date(value):
+    # DatePickerRange sends ISO strings; anything else is parsed day-first like the CSV
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        pass
+    try:
+        return pd.to_datetime(value, dayfirst=True).date()
+    except Exception:
+        return None
 
-], style={'padding': '22px'})
 def filter_df(df_in, countries, categories, start_date, end_date):
-    dff = df_in.copy()
+    if isinstance(countries, str):
+        countries = [countries]
+    if isinstance(categories, str):
+        categories = [categories]
+    sd = parse_filter_date(start_date)
+    ed = parse_filter_date(end_date)
+    mask = pd.Series(True, index=df_in.index)
     if countries:
-        if isinstance(countries, str):
-            countries = [countries]
-        dff = dff[dff['Country'].isin(countries)]
+        mask &= df_in['Country'].isin(countries)
     if categories:
-        if isinstance(categories, str):
-            categories = [categories]
-        dff = dff[dff['Category'].isin(categories)]
-    if start_date:
-        try:
-            sd = pd.to_datetime(start_date, dayfirst=True).date()
-            dff = dff[dff['Date'] >= sd]
-        except Exception:
-            pass
-    if end_date:
+        mask &= df_in['Category'].isin(categories)
+    # whole days on PurchaseDate (the compacted frame has no Date column)
+    if sd is not None:
+        mask &= df_in['PurchaseDate'] >= pd.Timestamp(sd)
+    if ed is not None:
+        mask &= df_in['PurchaseDate'] < pd.Timestamp(ed) + pd.Timedelta(days=1)
+    return df_in[mask]
+
+# Cache of backend results (rollups, customer counts, scatter points) shared by
+# every callback. Entries are keyed on the name of the result plus the
+# normalized filter state, evicted LRU and capped by both entry count and
+# approximate memory. Concurrent requests for the same key wait for the first
+# one instead of querying the backend again, for at most FILTER_CACHE_WAIT_SECONDS
+# before computing it themselves.
+FILTER_CACHE_MAX_ENTRIES = int(os.environ.get('FILTER_CACHE_MAX_ENTRIES', '32'))
+FILTER_CACHE_MAX_MB = float(os.environ.get('FILTER_CACHE_MAX_MB', '512'))
+FILTER_CACHE_WAIT_SECONDS = float(os.environ.get('FILTER_CACHE_WAIT_SECONDS', '30'))
+
+def filter_key(countries, categories, start_date, end_date):
+    def values(v):
+        if not v:
+            return ()
+        if isinstance(v, str):
+            v = [v]
+        return tuple(sorted(set(v)))
+
+    def day(v):
+        d = parse_filter_date(v)
+        return d.isoformat() if d is not None else None
+
+    return values(countries), values(categories), day(start_date), day(end_date)
+
+def filter_state(countries, categories, start_date, end_date):
+    # What backends take: lists of values and datetime.date bounds (or None)
+    key = filter_key(countries, categories, start_date, end_date)
+    return list(key[0]), list(key[1]), parse_filter_date(key[2]), parse_filter_date(key[3])
+
+def result_nbytes(value):
+    # shallow size: filtered frames share string objects with the source frame
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, tuple):
+        return sum(result_nbytes(v) for v in value)
+    return int(getattr(value, 'nbytes', 64))
+
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+class FilterCache:
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (result, nbytes)
+        self._pending = {}
+        self._bytes = 0
+        self._generation = 0  # bumped by invalidate() so in-flight results for stale data aren't stored
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            generation = self._generation
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _Pending()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            if pending.event.wait(FILTER_CACHE_WAIT_SECONDS) and pending.value is not None:
+                return pending.value
+            return compute()  # the owner failed or is stuck; don't swallow our own error
         try:
-            ed = pd.to_datetime(end_date, dayfirst=True).date()
-            dff = dff[dff['Date'] <= ed]
-        except Exception:
-            pass
-    return dff
+            value = compute()
+            pending.value = value
+            self._store(key, value, generation)
+            return value
+        finally:
+            with self._lock:
+                if self._pending.get(key) is pending:
+                    del self._pending[key]
+            pending.event.set()
+
+    def _store(self, key, value, generation):
+        nbytes = result_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self._generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def invalidate(self, affected):
+        # Drop the entries (and in-flight computations) whose key satisfies
+        # `affected`. The predicate runs outside the lock, so lookups aren't held
+        # up meanwhile; only what was there when it started is dropped, as
+        # anything stored since comes from a computation started after the bump.
+        with self._lock:
+            self._generation += 1
+            entries = dict(self._entries)
+            pending = dict(self._pending)
+        stale = [(k, v) for k, v in entries.items() if affected(k)]
+        waited = [(k, v) for k, v in pending.items() if affected(k)]
+        with self._lock:
+            for key, entry in stale:
+                if self._entries.get(key) is entry:
+                    self._bytes -= self._entries.pop(key)[1]
+            for key, owner in waited:
+                if self._pending.get(key) is owner:
+                    del self._pending[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def after_fork(self):
+        # In a forked child only the forking thread exists: a lock held by, or
+        # a computation owned by, another thread of the parent never finishes
+        self._lock = threading.Lock()
+        self._pending = {}
+
+filter_cache = FilterCache(FILTER_CACHE_MAX_ENTRIES, int(FILTER_CACHE_MAX_MB * 1024 * 1024))
+
+def _caches_after_fork():
+    # Background jobs are forked from a threaded worker (gunicorn's gthread),
+    # often while another thread is computing the same rollup
+    filter_cache.after_fork()
+    figure_cache.after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_caches_after_fork)
+
+def cached(name, countries, categories, start_date, end_date, compute):
+    # compute(backend, countries, categories, start, end), cached under (name,) + filter key
+    key = filter_key(countries, categories, start_date, end_date)
+    state = filter_state(countries, categories, start_date, end_date)
+    with metrics.stage('filter'):
+        # backend is read once get_or_compute has noted the cache generation, so a
+        # result computed on a dataset that was replaced meanwhile is never stored
+        value = filter_cache.get_or_compute((name,) + key, lambda: compute(backend, *state))
+    if isinstance(value, pd.DataFrame):
+        metrics.add_rows(len(value))
+    return value
+
+def cached_rollup(name, countries, categories, start_date, end_date):
+    return cached(name, countries, categories, start_date, end_date, lambda b, *state: b.query(name, *state))
+
+def cached_customers(countries, categories, start_date, end_date, exact=True):
+    return cached('unique_customers' if exact else 'unique_customers_approx', countries, categories, start_date, end_date,
+                  lambda b, *state: b.unique_customers(*state, exact=exact))
+
+def cached_cohorts(countries, categories, start_date, end_date, basis='signup'):
+    # a tuple name: cohorts depend on every customer's first month, so ingestion always drops them
+    return cached(('cohorts', basis), countries, categories, start_date, end_date,
+                  lambda b, *state: b.cohorts(*state, basis=basis))
+
+def cache_counts():
+    out = []
+    for name, c in (('filter', filter_cache), ('figure', figure_cache)):
+        out += [((name, 'hit'), c.hits), ((name, 'miss'), c.misses)]
+    return out
+
+def cache_hit_ratio():
+    out = []
+    for name, c in (('filter', filter_cache), ('figure', figure_cache)):
+        lookups = c.hits + c.misses
+        if lookups:
+            out.append(((name,), c.hits / lookups))
+    return out
+
+def cache_size():
+    out = []
+    for name, c in (('filter', filter_cache), ('figure', figure_cache)):
+        out += [((name, 'entries'), len(c._entries)), ((name, 'bytes'), c._bytes)]
+    return out
+
+metrics.Collected('dashboard_cache_lookups_total', 'Cache lookups by result', 'counter', ['cache', 'result'], cache_counts)
+metrics.Collected('dashboard_cache_hit_ratio', 'Cache hits over lookups since start', 'gauge', ['cache'], cache_hit_ratio)
+metrics.Collected('dashboard_cache_size', 'Cached entries and their approximate bytes', 'gauge', ['cache', 'unit'], cache_size)
+metrics.Collected('dashboard_dataset_rows', 'Rows in the dataset', 'gauge', [], lambda: [((), backend.rows())])
+
+# Figure payload limits: above these sizes charts are reduced on the server so
+# callback responses and browser render time stay flat as the data grows.
+TS_MAX_POINTS = int(os.environ.get('TS_MAX_POINTS', '1000'))
+SCATTER_MAX_POINTS = int(os.environ.get('SCATTER_MAX_POINTS', '5000'))
+SCATTER_DENSITY_POINTS = int(os.environ.get('SCATTER_DENSITY_POINTS', '100000'))
+SCATTER_BINS = int(os.environ.get('SCATTER_BINS', '60'))
+SUNBURST_MAX_PRODUCTS = int(os.environ.get('SUNBURST_MAX_PRODUCTS', '12'))
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: keep the first and last points and, from
+    # each bucket in between, the point spanning the largest triangle with the
+    # previous pick and the mean of the next bucket. Returns row positions.
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xs = np.asarray(x).astype('int64' if np.asarray(x).dtype.kind == 'M' else 'float64').astype('float64')
+    ys = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    picked = np.empty(n_out, dtype=int)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nhi = edges[i + 2] if i + 2 < len(edges) else n
+        mx, my = xs[hi:nhi].mean(), ys[hi:nhi].mean()
+        area = np.abs((xs[a] - mx) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (my - ys[a]))
+        a = lo + int(area.argmax())
+        picked[i + 1] = a
+    return picked
+
+def downsample_series(ts, x, y, max_points=TS_MAX_POINTS):
+    if len(ts) <= max_points:
+        return ts
+    return ts.iloc[lttb(ts[x].values, ts[y].values, max_points)]
+
+def collapse_tail(sb, parent, child, value, keep=SUNBURST_MAX_PRODUCTS):
+    # Keep the top `keep` children of every parent and fold the rest into 'Other'
+    rank = sb.groupby(parent, observed=True)[value].rank(method='first', ascending=False)
+    if (rank <= keep).all():
+        return sb
+    sb = sb.assign(**{child: sb[child].astype(str).where(rank <= keep, 'Other')})
+    return sb.groupby([parent, child], as_index=False, observed=True)[value].sum()
+
+def empty_figure(text):
+    fig = go.Figure()
+    fig.add_annotation(text=text, showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+    return fig
+
+def session_data(countries, categories, start_date, end_date, n):
+    # What the scatter plots for the n customers matching the filters (the
+    # backend computes their per-customer averages): a (counts, x edges,
+    # y edges) density grid, or a frame of points, sampled above SCATTER_MAX_POINTS
+    if n > SCATTER_DENSITY_POINTS:
+        # bin on the server: the payload is SCATTER_BINS^2 cells whatever n is
+        return cached('session_density', countries, categories, start_date, end_date,
+                      lambda b, *state: b.session_density(*state, SCATTER_BINS))
+    limit = SCATTER_MAX_POINTS if n > SCATTER_MAX_POINTS else None
+    # the sample and the full set are separate results: with approx counts, n
+    # for the same filters can fall on either side of the threshold
+    name = 'session_points' if limit is None else f'session_points_sample{limit}'
+    return cached(name, countries, categories, start_date, end_date,
+                  lambda b, *state: b.session_points(*state, limit=limit))
+
+def session_scatter(data, n):
+    title = 'Session Duration vs Avg Order Value'
+    if isinstance(data, tuple):
+        counts, xe, ye = data
+        with metrics.stage('figure'):
+            fig = go.Figure(go.Heatmap(z=np.where(counts.T > 0, counts.T, np.nan), x=(xe[:-1] + xe[1:]) / 2,
+                                       y=(ye[:-1] + ye[1:]) / 2, colorscale='Blues', colorbar=dict(title='Customers')))
+            fig.update_layout(title=f'{title} (density of {n:,} customers)', xaxis_title='SessionDuration', yaxis_title='AvgOrderValue')
+        return fig
+    cust = data
+    with metrics.stage('figure'):
+        if n > SCATTER_MAX_POINTS:
+            return px.scatter(cust, x='SessionDuration', y='AvgOrderValue', size='AvgOrderValue', render_mode='webgl',
+                              title=f'{title} (sample of {len(cust):,} / {n:,} customers)')
+        return px.scatter(cust, x='SessionDuration', y='AvgOrderValue', size='AvgOrderValue', title=title)
+
+def sparkline_figure(ts):
+    if ts.empty:
+        fig = empty_figure('No data')
+        fig.update_layout(margin=dict(l=0, r=0, t=4, b=4), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+        return fig
+    fig = px.area(ts, x='Month', y='TotalAmount')
+    fig.update_traces(line=dict(width=1))
+    fig.update_layout(xaxis=dict(visible=False), yaxis=dict(visible=False),
+                      margin=dict(l=0, r=0, t=4, b=4), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+    return fig
+
+def time_series_figure(ts):
+    if ts.empty:
+        return empty_figure('No data')
+    fig = px.line(ts, x='Month', y='TotalAmount', title='Revenue over Time')
+    fig.update_layout(margin=dict(l=40, r=20, t=40, b=30))
+    return fig
+
+def category_figure(cat):
+    if cat is None:
+        return empty_figure('No category data')
+    fig = px.bar(cat, x='TotalAmount', y='Category', orientation='h', title='Revenue by Category')
+    fig.update_layout(margin=dict(l=80, r=20, t=40, b=30))
+    return fig
+
+def products_figure(prod):
+    if prod is None:
+        return empty_figure('No product data')
+    fig = px.bar(prod, x='TotalAmount', y='ProductName', orientation='h', title='Top 10 Products')
+    fig.update_layout(margin=dict(l=120, r=20, t=40, b=30))
+    return fig
+
+def map_figure(country_agg):
+    if country_agg is None:
+        return empty_figure('No country data')
+    fig = px.choropleth(country_agg, locations='Country', locationmode='country names',
+                        color='TotalAmount', hover_name='Country',
+                        color_continuous_scale='Blues', title='Revenue by Country')
+    fig.update_layout(margin=dict(l=0, r=0, t=40, b=0))
+    return fig
+
+def sunburst_figure(sb):
+    if sb is None:
+        return empty_figure('No category/product data')
+    fig = px.sunburst(sb, path=['Category', 'ProductName'], values='TotalAmount', title='Revenue: Category → Product')
+    fig.update_layout(margin=dict(l=10, r=10, t=40, b=10))
+    return fig
+
+def gender_figure(gender):
+    return px.pie(gender, values='Count', names='Gender', title='Gender Distribution') if gender is not None else empty_figure('No gender data')
+
+def referral_figure(ref):
+    if ref is None:
+        return empty_figure('No referral data')
+    return px.bar(ref.head(10), x='Count', y='ReferralSource', orientation='h', title='Top Referral Sources')
+
+def cohort_figure(coh, measure):
+    # rows: cohort month; columns: months since it; cells: share of the cohort's
+    # customers (active within the filter) buying that month, or their revenue
+    if coh.empty or not coh['Customers'].any():
+        return empty_figure('No cohort data')
+    coh = coh.assign(Cohort=coh['Cohort'].dt.strftime('%Y-%m'),
+                     Retention=coh['Customers'] / coh['CohortCustomers'].where(coh['CohortCustomers'] > 0) * 100)
+    value = 'Retention' if measure == 'retention' else 'Revenue'
+    grid = coh.pivot(index='Cohort', columns='MonthsSince', values=value)
+    fig = go.Figure(go.Heatmap(
+        z=grid.to_numpy(), x=grid.columns, y=grid.index, colorscale='Purples',
+        colorbar=dict(title='%' if value == 'Retention' else 'Revenue'),
+        hovertemplate='Cohort %{y}, month %{x}: %{z:,.1f}' + ('%' if value == 'Retention' else '') + '<extra></extra>'))
+    fig.update_layout(title=f'{"Retention" if value == "Retention" else "Revenue"} by Cohort',
+                      xaxis_title='Months since cohort month', yaxis=dict(title='Cohort', autorange='reversed', type='category'),
+                      margin=dict(l=70, r=20, t=40, b=40))
+    return fig
+
+def customer_margins(fig):
+    fig.update_layout(margin=dict(l=30, r=20, t=40, b=30))
+    return fig
+
+# One request per filter change for the KPIs, the light figures and the
+# download links, over the cached 'sales' and 'customers' rollups; the map,
+# sunburst and scatter follow in a background job (update_heavy_charts). The
+# browser keeps a digest per output ('figure-digests' / 'heavy-digests'
+# stores). An output whose inputs (the small frame it plots) are unchanged is
+# skipped with no_update; a figure whose layout is unchanged is sent as a Patch
+# of its traces, so the layout and template (e.g. the map's geo settings)
+# aren't re-sent.
+
+# Requests per filter state, so warm_figures knows the most frequent views
+_view_counts = Counter()
+_view_lock = threading.Lock()
+
+def note_view(countries, categories, start_date, end_date, exact):
+    with _view_lock:
+        _view_counts[filter_key(countries, categories, start_date, end_date) + (exact,)] += 1
+        if len(_view_counts) > 1000:
+            kept = _view_counts.most_common(100)
+            _view_counts.clear()
+            _view_counts.update(dict(kept))
+
+FILTER_INPUTS = [
+    Input('country-filter', 'value'),
+    Input('category-filter', 'value'),
+    Input('date-range', 'start_date'),
+    Input('date-range', 'end_date'),
+    Input('customers-exact', 'value'),
+]
+
 @app.callback(
     Output('kpi-revenue', 'children'),
     Output('kpi-orders', 'children'),
     Output('kpi-customers', 'children'),
     Output('kpi-aov', 'children'),
     Output('sparkline-revenue', 'figure'),
-    Input('country-filter', 'value'),
-    Input('category-filter', 'value'),
-    Input('date-range', 'start_date'),
-    Input('date-range', 'end_date')
-)
-def update_kpis_and_sparkline(countries, categories, start_date, end_date):
-    dff = filter_df(df, countries or [], categories or [], start_date, end_date)
-    revenue = dff['TotalAmount'].sum() if 'TotalAmount' in dff.columns else 0
-    orders = len(dff)
-    customers = dff['UserID'].nunique() if 'UserID' in dff.columns else (dff['UserName'].nunique() if 'UserName' in dff.columns else 0)
-    aov = revenue / orders if orders > 0 else 0
-
-    ts_small = dff.groupby('Month', as_index=False)['TotalAmount'].sum().sort_values('Month') if 'Month' in dff.columns and 'TotalAmount' in dff.columns else pd.DataFrame()
-    if ts_small.empty:
-        fig_sp = go.Figure()
-        fig_sp.add_annotation(text='No data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
-        fig_sp.update_layout(margin=dict(l=0, r=0, t=4, b=4), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-    else:
-        fig_sp = px.area(ts_small, x='Month', y='TotalAmount')
-        fig_sp.update_traces(line=dict(width=1))
-        fig_sp.update_layout(xaxis=dict(visible=False), yaxis=dict(visible=False),
-                             margin=dict(l=0, r=0, t=4, b=4), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
-
-    return f"₹{revenue:,.2f}", f"{orders:,}", f"{customers:,}", f"₹{aov:,.2f}", fig_sp
-
-@app.callback(
     Output('sales-time-series', 'figure'),
     Output('sales-by-category', 'figure'),
     Output('top-products', 'figure'),
-    Input('country-filter', 'value'),
-    Input('category-filter', 'value'),
-    Input('date-range', 'start_date'),
-    Input('date-range', 'end_date')
+    Output('gender-pie', 'figure'),
+    Output('referral-bar', 'figure'),
+    Output('download-link', 'href'),
+    Output('download-parquet-link', 'href'),
+    Output('figure-digests', 'data'),
+    *FILTER_INPUTS,
+    State('figure-digests', 'data')
 )
-def update_sales_charts(countries, categories, start_date, end_date):
-    dff = filter_df(df, countries or [], categories or [], start_date, end_date)
+@metrics.instrumented
+def update_dashboard(countries, categories, start_date, end_date, exact_toggle=None, digests=None):
+    note_view(countries, categories, start_date, end_date, not APPROX_CUSTOMERS or bool(exact_toggle))
+    return render_dashboard(countries, categories, start_date, end_date, exact_toggle, digests)
 
-    # time series
-    if 'Month' in dff.columns and 'TotalAmount' in dff.columns:
-        ts = dff.groupby('Month', as_index=False)['TotalAmount'].sum().sort_values('Month')
-    else:
-        ts = pd.DataFrame()
-    if ts.empty:
-        fig_ts = go.Figure()
-        fig_ts.add_annotation(text='No data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
-    else:
-        fig_ts = px.line(ts, x='Month', y='TotalAmount', title='Revenue over Time')
-        fig_ts.update_layout(margin=dict(l=40, r=20, t=40, b=30))
-
-    # category bars
-    if 'Category' in dff.columns and not dff.empty and 'TotalAmount' in dff.columns:
-        cat = dff.groupby('Category', as_index=False)['TotalAmount'].sum().sort_values('TotalAmount', ascending=False)
-        fig_cat = px.bar(cat, x='TotalAmount', y='Category', orientation='h', title='Revenue by Category')
-        fig_cat.update_layout(margin=dict(l=80, r=20, t=40, b=30))
-    else:
-        fig_cat = go.Figure()
-        fig_cat.add_annotation(text='No category data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
-         # top products
-    if 'ProductName' in dff.columns and not dff.empty and 'TotalAmount' in dff.columns:
-        prod = dff.groupby('ProductName', as_index=False)['TotalAmount'].sum().sort_values('TotalAmount', ascending=False).head(10)
-        fig_prod = px.bar(prod, x='TotalAmount', y='ProductName', orientation='h', title='Top 10 Products')
-        fig_prod.update_layout(margin=dict(l=120, r=20, t=40, b=30))
-    else:
-        fig_prod = go.Figure()
-        fig_prod.add_annotation(text='No product data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+def render_dashboard(countries, categories, start_date, end_date, exact_toggle=None, digests=None):
+    digests = dict(digests or {})
+    sales = cached_rollup('sales', countries, categories, start_date, end_date)
+    customers = cached_rollup('customers', countries, categories, start_date, end_date)
+    exact = not APPROX_CUSTOMERS or bool(exact_toggle)
+    n_customers = cached_customers(countries, categories, start_date, end_date, exact)
 
-    return fig_ts, fig_cat, fig_prod
+    with metrics.stage('groupby'):
+        revenue = sales['TotalAmount'].sum()
+        orders = int(sales['Orders'].sum())
+        aov = revenue / orders if orders > 0 else 0
+        ts = downsample_series(sales.groupby('Month', as_index=False)['TotalAmount'].sum().sort_values('Month'), 'Month', 'TotalAmount')
+        cat = prod = gender = ref = None
+        if not sales.empty:
+            if 'Category' in sales.columns:
+                cat = sales.groupby('Category', as_index=False, observed=True)['TotalAmount'].sum().sort_values('TotalAmount', ascending=False)
+            if 'ProductName' in sales.columns:
+                prod = sales.groupby('ProductName', as_index=False, observed=True)['TotalAmount'].sum().sort_values('TotalAmount', ascending=False).head(10)
+        if not customers.empty:
+            if 'Gender' in customers.columns:
+                gender = customers.groupby('Gender', observed=True)['Orders'].sum().sort_values(ascending=False).reset_index()
+                gender.columns = ['Gender', 'Count']
+            if 'ReferralSource' in customers.columns:
+                ref = customers.groupby('ReferralSource', observed=True)['Orders'].sum().sort_values(ascending=False).reset_index()
+                ref.columns = ['ReferralSource', 'Count']
 
-@app.callback(
+    key = filter_key(countries, categories, start_date, end_date)
+    base = app.get_relative_path('/export')
+    outputs = [
+        ('revenue', [revenue], lambda: f"₹{revenue:,.2f}"),
+        ('orders', [orders], lambda: f"{orders:,}"),
+        ('customers', [n_customers, exact], lambda: f"{n_customers:,}" if exact else f"≈{n_customers:,}"),
+        ('aov', [aov], lambda: f"₹{aov:,.2f}"),
+        ('sparkline', ['sparkline', ts], lambda: sparkline_figure(ts)),
+        ('time_series', ['time_series', ts], lambda: time_series_figure(ts)),
+        ('category', [cat], lambda: category_figure(cat)),
+        ('products', [prod], lambda: products_figure(prod)),
+        ('gender', [gender], lambda: customer_margins(gender_figure(gender))),
+        ('referral', [ref], lambda: customer_margins(referral_figure(ref))),
+        ('csv_link', [key], lambda: f"{base}?{export_query(countries, categories, start_date, end_date)}"),
+        ('parquet_link', [key], lambda: f"{base}?{export_query(countries, categories, start_date, end_date, 'parquet')}"),
+    ]
+    results = [render_output(name, digests, inputs, build) for name, inputs, build in outputs]
+    return (*results, digests)
+
+def render_heavy_charts(countries, categories, start_date, end_date, exact_toggle=None, digests=None, set_progress=None):
+    # Map, sunburst and session scatter; set_progress((done, total)) after each one
+    digests = dict(digests or {})
+    report = set_progress or (lambda value: None)
+    report(('0', '3'))
+    sales = cached_rollup('sales', countries, categories, start_date, end_date)
+    with metrics.stage('groupby'):
+        country_agg = sb = None
+        if not sales.empty and 'Country' in sales.columns:
+            country_agg = sales.groupby('Country', as_index=False, observed=True)['TotalAmount'].sum().sort_values('TotalAmount', ascending=False)
+    fig_map = render_output('map', digests, [country_agg], lambda: map_figure(country_agg))
+    report(('1', '3'))
+
+    with metrics.stage('groupby'):
+        if not sales.empty and 'Category' in sales.columns and 'ProductName' in sales.columns:
+            sb = sales.groupby(['Category', 'ProductName'], as_index=False, observed=True)['TotalAmount'].sum()
+            sb = collapse_tail(sb, 'Category', 'ProductName', 'TotalAmount')
+    fig_sb = render_output('sunburst', digests, [sb], lambda: sunburst_figure(sb))
+    report(('2', '3'))
+
+    # the sample/density choice follows the count, so an exact/approx switch can redraw it
+    n_customers = cached_customers(countries, categories, start_date, end_date, not APPROX_CUSTOMERS or bool(exact_toggle))
+    has_sessions = 'SessionDuration' in backend.columns and 'UserID' in backend.columns
+    data = session_data(countries, categories, start_date, end_date, n_customers) if has_sessions and n_customers else None
+    # keyed on what is plotted, so orders ingested for existing customers redraw it
+    parts = list(data) if isinstance(data, tuple) else [data]
+    fig_scatter = render_output('scatter', digests, [*parts, n_customers],
+                                lambda: customer_margins(
+                                    session_scatter(data, n_customers) if data is not None
+                                    else empty_figure('No session or user data')))
+    report(('3', '3'))
+    return fig_map, fig_sb, fig_scatter, digests
+
+HEAVY_OUTPUTS = [
     Output('sales-world-map', 'figure'),
     Output('category-sunburst', 'figure'),
-    Input('country-filter', 'value'),
-    Input('category-filter', 'value'),
-    Input('date-range', 'start_date'),
-    Input('date-range', 'end_date')
-)
-def update_map_and_sunburst(countries, categories, start_date, end_date):
-    dff = filter_df(df, countries or [], categories or [], start_date, end_date)
-
-    # choropleth
-    if 'Country' in dff.columns and not dff.empty and 'TotalAmount' in dff.columns:
-        country_agg = dff.groupby('Country', as_index=False)['TotalAmount'].sum().sort_values('TotalAmount', ascending=False)
-        fig_map = px.choropleth(country_agg, locations='Country', locationmode='country names',
-                                color='TotalAmount', hover_name='Country',
-                                color_continuous_scale='Blues', title='Revenue by Country')
-        fig_map.update_layout(margin=dict(l=0, r=0, t=40, b=0))
-    else:
-        fig_map = go.Figure()
-        fig_map.add_annotation(text='No country data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
-
-    # sunburst
-    if 'Category' in dff.columns and 'ProductName' in dff.columns and not dff.empty and 'TotalAmount' in dff.columns:
-        sb = dff.groupby(['Category', 'ProductName'], as_index=False)['TotalAmount'].sum()
-        fig_sb = px.sunburst(sb, path=['Category', 'ProductName'], values='TotalAmount', title='Revenue: Category → Product')
-        fig_sb.update_layout(margin=dict(l=10, r=10, t=40, b=10))
-    else:
-        fig_sb = go.Figure()
-        fig_sb.add_annotation(text='No category/product data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+    Output('session-scatter', 'figure'),
+    Output('heavy-digests', 'data'),
+]
 
-    return fig_map, fig_sb
+if background_manager is not None:
+    # A filter change while a job runs starts a new one and the renderer has
+    # the old one terminated, so stale jobs never finish in the background.
+    # (Not wrapped in metrics.instrumented: the job runs in its own process.)
+    @app.callback(
+        *HEAVY_OUTPUTS,
+        *FILTER_INPUTS,
+        State('heavy-digests', 'data'),
+        background=True,
+        progress=[Output('heavy-progress', 'value'), Output('heavy-progress', 'max')],
+        running=[(Output('heavy-status', 'style'), {'display': 'block', 'marginBottom': 10}, {'display': 'none'})],
+        interval=500,
+    )
+    def update_heavy_charts(set_progress, countries, categories, start_date, end_date, exact_toggle=None, digests=None):
+        return render_heavy_charts(countries, categories, start_date, end_date, exact_toggle, digests, set_progress)
+else:
+    @app.callback(*HEAVY_OUTPUTS, *FILTER_INPUTS, State('heavy-digests', 'data'))
+    @metrics.instrumented
+    def update_heavy_charts(countries, categories, start_date, end_date, exact_toggle=None, digests=None):
+        return render_heavy_charts(countries, categories, start_date, end_date, exact_toggle, digests)
+
+def render_cohorts(countries, categories, start_date, end_date, basis='signup', measure='retention', digests=None):
+    digests = dict(digests or {})
+    has_cohorts = 'UserID' in backend.columns and (basis != 'signup' or 'SignUpDate' in backend.columns)
+    coh = cached_cohorts(countries, categories, start_date, end_date, basis) if has_cohorts else None
+    fig = render_output('cohorts', digests, [coh, basis, measure],
+                        lambda: cohort_figure(coh, measure) if coh is not None else empty_figure('No customer or signup data'))
+    return fig, digests
 
 @app.callback(
-    Output('gender-pie', 'figure'),
-    Output('referral-bar', 'figure'),
-    Output('session-scatter', 'figure'),
-    Input('country-filter', 'value'),
-    Input('category-filter', 'value'),
-    Input('date-range', 'start_date'),
-    Input('date-range', 'end_date')
+    Output('cohort-heatmap', 'figure'),
+    Output('cohort-digests', 'data'),
+    *FILTER_INPUTS[:4],
+    Input('cohort-basis', 'value'),
+    Input('cohort-measure', 'value'),
+    State('cohort-digests', 'data'),
 )
-def update_customer_charts(countries, categories, start_date, end_date):
-    dff = filter_df(df, countries or [], categories or [], start_date, end_date)
+@metrics.instrumented
+def update_cohorts(countries, categories, start_date, end_date, basis='signup', measure='retention', digests=None):
+    return render_cohorts(countries, categories, start_date, end_date, basis, measure, digests)
 
-    if 'Gender' in dff.columns and not dff.empty:
-        gender = dff['Gender'].value_counts().reset_index()
-        gender.columns = ['Gender', 'Count']
-        fig_gender = px.pie(gender, values='Count', names='Gender', title='Gender Distribution')
-    else:
-        fig_gender = go.Figure()
-        fig_gender.add_annotation(text='No gender data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+# Orders table: pages, sorting and column filters are all served from here, so
+# the browser never holds more than one page. The matching rows of a view
+# (dashboard filters + table sort + table filters) are found once and cached
+# like the rollups; each page is then a slice of them.
+TABLE_OPERATORS = {'>=': 'ge', '<=': 'le', '<': 'lt', '>': 'gt', '!=': 'ne', '=': 'eq',
+                   'ge': 'ge', 'le': 'le', 'lt': 'lt', 'gt': 'gt', 'ne': 'ne', 'eq': 'eq',
+                   'contains': 'contains', 'datestartswith': 'datestartswith'}
+FILTER_PART = re.compile(r'\s*\{([^}]*)\}\s*([is]?(?:[<>!]?=|[<>])|[A-Za-z]+)\s*(.*)$', re.S)
 
-    if 'ReferralSource' in dff.columns and not dff.empty:
-        ref = dff['ReferralSource'].value_counts().reset_index()
-        ref.columns = ['ReferralSource', 'Count']
-        fig_ref = px.bar(ref.head(10), x='Count', y='ReferralSource', orientation='h', title='Top Referral Sources')
-    else:
-        fig_ref = go.Figure()
-        fig_ref.add_annotation(text='No referral data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
-
-    if 'SessionDuration' in dff.columns and 'UserID' in dff.columns and not dff.empty:
-        cust = dff.groupby('UserID', as_index=False).agg({'SessionDuration': 'mean', 'TotalAmount': 'mean'}).rename(columns={'TotalAmount': 'AvgOrderValue'})
-        if cust.empty:
-            fig_scatter = go.Figure()
-            fig_scatter.add_annotation(text='No session/customer data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+def split_filter_part(part):
+    # '{Price} >= 100' -> ('Price', 'ge', '100'). The operator is the token right
+    # after the column, so one inside the value ('Isle of Man') isn't matched.
+    # Quotes around the value are dropped; case prefixes (icontains, seq) ignored.
+    match = FILTER_PART.match(part)
+    if match is None:
+        return None, None, None
+    name, op, value = match.group(1), match.group(2).lower(), match.group(3).strip()
+    if op not in TABLE_OPERATORS and op[:1] in ('i', 's'):
+        op = op[1:]
+    if op not in TABLE_OPERATORS:
+        return None, None, None
+    quote = value[:1]
+    if len(value) > 1 and quote in ('"', "'", '`') and value[-1] == quote:
+        value = value[1:-1].replace('\\' + quote, quote)
+    return name, TABLE_OPERATORS[op], value
+
+def parse_table_filter(filter_query):
+    # DataTable filter_query -> backend conditions; unparseable parts are ignored.
+    # A date value is a prefix ('2023', '2023-05', '2023-05-14') naming a period.
+    types = dict(TABLE_COLUMNS)
+    conditions = []
+    for part in (filter_query or '').split(' && '):
+        col, op, value = split_filter_part(part)
+        if col not in types or col not in backend.columns or value == '':
+            continue
+        if types[col] == 'datetime':
+            try:
+                period = pd.Period(value)
+            except ValueError:
+                continue
+            lo, hi = period.start_time.date(), (period + 1).start_time.date()
+            ranges = {'eq': [('ge', lo), ('lt', hi)], 'datestartswith': [('ge', lo), ('lt', hi)],
+                      'contains': [('ge', lo), ('lt', hi)], 'lt': [('lt', lo)], 'le': [('lt', hi)],
+                      'gt': [('ge', hi)], 'ge': [('ge', lo)]}
+            conditions += [(col, o, v) for o, v in ranges.get(op, [])]
+        elif op in ('contains', 'datestartswith'):
+            conditions.append((col, 'contains', value))
+        elif types[col] == 'numeric':
+            try:
+                conditions.append((col, op, float(value)))
+            except ValueError:
+                continue
+        else:
+            conditions.append((col, op, value))
+    return tuple(conditions)
+
+def table_records(frame):
+    cols = [c for c, _ in TABLE_COLUMNS if c in frame.columns]
+    out = {}
+    for c in cols:
+        values = frame[c]
+        if values.dtype.kind == 'M':
+            out[c] = iso_text(values)
+        elif values.dtype.kind == 'f':
+            out[c] = values.astype('float64').round(2).to_numpy(dtype=object)
         else:
-            fig_scatter = px.scatter(cust, x='SessionDuration', y='AvgOrderValue', size='AvgOrderValue', title='Session Duration vs Avg Order Value')
+            out[c] = values.to_numpy(dtype=object)
+        out[c] = [None if v is None or v != v else v for v in out[c]]  # NaN -> empty cell
+    return [dict(zip(cols, row)) for row in zip(*(out[c] for c in cols))]
+
+@app.callback(
+    Output('orders-table', 'data'),
+    Output('orders-table', 'page_count'),
+    Output('orders-table', 'page_current'),
+    Output('orders-count', 'children'),
+    Output('orders-view', 'data'),
+    *FILTER_INPUTS[:4],
+    Input('orders-table', 'page_current'),
+    Input('orders-table', 'page_size'),
+    Input('orders-table', 'sort_by'),
+    Input('orders-table', 'filter_query'),
+    State('orders-view', 'data'),
+)
+@metrics.instrumented
+def update_orders_table(countries, categories, start_date, end_date, page_current=0, page_size=None,
+                        sort_by=None, filter_query=None, view=None):
+    columns = dict(TABLE_COLUMNS)
+    sort = tuple((s['column_id'], s['direction'] == 'asc') for s in sort_by or () if s.get('column_id') in columns)
+    conditions = parse_table_filter(filter_query)
+    rows = cached(('orders_table', sort, conditions), countries, categories, start_date, end_date,
+                  lambda b, *state: b.table_rows(*state, sort, conditions))
+    # a different view starts again at its first page
+    key = content_digest(filter_key(countries, categories, start_date, end_date), sort, conditions)
+    page = (page_current or 0) if key == view else 0
+    size = page_size or TABLE_PAGE_SIZE
+    total = len(rows)
+    page_count = max(-(-total // size), 1)
+    page = min(page, page_count - 1)
+    with metrics.stage('filter'):
+        frame = rows.page(page * size, size)
+    metrics.add_rows(len(frame))
+    data = table_records(frame)
+    return (data, page_count, page if page != page_current else no_update,
+            f'{total:,} matching orders', key if key != view else no_update)
+
+# Warm-up: render the default view (no filters, the full date range) and the
+# FIGURE_WARM_STATES most requested views into the figure cache. It runs at
+# the end of the import, so with gunicorn's preload every worker starts warm, and again in a
+# background thread after each data reload. Background jobs are forked from
+# the worker and read its cache, but what they render isn't kept.
+FIGURE_WARM_STATES = int(os.environ.get('FIGURE_WARM_STATES', '8'))
+
+def warm_figures():
+    views = [filter_key([], [], *backend.date_span()) + (not APPROX_CUSTOMERS,)]
+    with _view_lock:
+        popular = [view for view, _ in _view_counts.most_common(FIGURE_WARM_STATES)]
+    views += [view for view in popular if view not in views]
+    for countries, categories, start_date, end_date, exact in views:
+        toggle = ['exact'] if exact else []
+        # not through the callbacks, so warm-up doesn't count as a request or a view
+        render_dashboard(list(countries), list(categories), start_date, end_date, toggle)
+        render_heavy_charts(list(countries), list(categories), start_date, end_date, toggle)
+        render_cohorts(list(countries), list(categories), start_date, end_date)
+    return len(views)
+
+_warm_lock = threading.Lock()
+_warm_thread = None
+_warm_pending = False
+
+def warm_in_background():
+    # One warm-up thread at a time; a reload during a warm-up runs it once more
+    global _warm_thread, _warm_pending
+    if FIGURE_CACHE_MAX_MB <= 0:
+        return
+    with _warm_lock:
+        _warm_pending = True
+        if _warm_thread is None:
+            _warm_thread = threading.Thread(target=_warm_loop, name='figure-warmup', daemon=True)
+            _warm_thread.start()
+
+def _warm_loop():
+    global _warm_thread, _warm_pending
+    while True:
+        with _warm_lock:
+            if not _warm_pending:
+                _warm_thread = None
+                return
+            _warm_pending = False
+        try:
+            warm_figures()
+        except Exception as e:
+            print(f'Figure warm-up failed: {e}')
+
+# Streaming export: the filtered rows are written in chunks straight into the
+# response, so memory stays bounded by EXPORT_CHUNK_ROWS however many rows match
+# and the export doesn't block the callbacks served by other threads.
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', '50000'))
+
+def export_query(countries, categories, start_date, end_date, fmt=None):
+    key = filter_key(countries, categories, start_date, end_date)
+    params = [('country', c) for c in key[0]] + [('category', c) for c in key[1]]
+    params += [(name, value) for name, value in (('start', key[2]), ('end', key[3]), ('format', fmt)) if value]
+    return urlencode(params)
+
+def stream_csv_gz(chunks):
+    gz = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    header = True
+    for chunk in chunks:
+        out = gz.compress(chunk.to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+        if out:
+            yield out
+    yield gz.flush()
+
+class _ParquetSink(io.RawIOBase):
+    # Write-only file that hands out what has been written so far
+    def __init__(self):
+        self._parts = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._parts.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        out = b''.join(self._parts)
+        self._parts.clear()
+        return out
+
+def stream_parquet(chunks):
+    sink = _ParquetSink()
+    writer = None
+    for chunk in chunks:
+        # plain values per row group, so each group doesn't embed the full category dictionaries
+        cats = {c: chunk[c].cat.categories.dtype for c in chunk.columns if isinstance(chunk[c].dtype, pd.CategoricalDtype)}
+        table = pa.Table.from_pandas(chunk.astype(cats), preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+@server.route('/export')
+def export_filtered():
+    args = request.args
+    state = filter_state(args.getlist('country'), args.getlist('category'), args.get('start'), args.get('end'))
+    chunks = backend.iter_rows(*state, EXPORT_CHUNK_ROWS)
+    if args.get('format') == 'parquet':
+        if pq is None:
+            return jsonify(error='Parquet export requires pyarrow'), 501
+        body, mimetype, filename = stream_parquet(chunks), 'application/vnd.apache.parquet', 'filtered_sales.parquet'
     else:
-        fig_scatter = go.Figure()
-        fig_scatter.add_annotation(text='No session or user data', showarrow=False, xref='paper', yref='paper', x=0.5, y=0.5)
+        body, mimetype, filename = stream_csv_gz(chunks), 'application/gzip', 'filtered_sales.csv.gz'
+    return Response(body, mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+def batch_touches(batch, key):
+    # Cache keys end with the normalized filter state (countries, categories, start, end)
+    countries, categories, start_date, end_date = key[-4:]
+    return len(filter_df(batch, list(countries), list(categories), start_date, end_date)) > 0
+
+def ingest_pending():
+    global backend
+    if not isinstance(backend, PandasBackend):
+        # SQL stores are loaded directly; drop cached results once they change
+        if backend.refresh():
+            filter_cache.clear()
+            figure_cache.decay()
+            warm_in_background()
+            print(f'{DATA_PATH} changed; dataset version {backend.version}')
+        return 0
+    with _ingest_lock:
+        names, batch = read_pending_batches()
+        _ingested_files.update(names)
+        if batch is None or batch.empty:
+            return 0
+        backend = backend.append(batch)
+        version = backend.version
+    # orders table views hold the frame they index (name ('orders_table', ...)) and cohorts
+    # depend on every customer's first month (('cohorts', basis)), so all of those go
+    touched = {}  # per filter state: many cached results share one
+
+    def affected(key):
+        if isinstance(key[0], tuple):
+            return True
+        if key[-4:] not in touched:
+            touched[key[-4:]] = batch_touches(batch, key)
+        return touched[key[-4:]]
+
+    filter_cache.invalidate(affected)
+    figure_cache.decay()
+    warm_in_background()
+    print(f'Ingested {len(batch):,} rows from {len(names)} file(s); dataset version {version}')
+    return len(batch)
 
-    for fig in (fig_gender, fig_ref, fig_scatter):
-        fig.update_layout(margin=dict(l=30, r=20, t=40, b=30))
+_ingest_watcher = None
+
+def start_ingest_watcher():
+    # Threads don't survive fork, so every gunicorn worker starts its own (see gunicorn.conf.py)
+    global _ingest_watcher
+    if INGEST_POLL_SECONDS <= 0 or _ingest_watcher is not None:
+        return
+
+    def watch():
+        while True:
+            time.sleep(INGEST_POLL_SECONDS)
+            try:
+                ingest_pending()
+            except Exception as e:
+                print(f'Ingest failed: {e}')
+
+    _ingest_watcher = threading.Thread(target=watch, name='ingest-watcher', daemon=True)
+    _ingest_watcher.start()
+
+@server.route('/ingest', methods=['POST'])
+def ingest_upload():
+    # Body: a CSV batch with the dataset's columns. It is written to the drop
+    # directory (atomically, via a .part file) so the other workers see it too.
+    if not INGEST_TOKEN:
+        return jsonify(error='Ingestion API is disabled; set INGEST_TOKEN'), 404
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {INGEST_TOKEN}'):
+        return jsonify(error='Unauthorized'), 401
+    if not isinstance(backend, PandasBackend):
+        return jsonify(error=f'Load new rows into {DATA_PATH} directly; the {backend.name} backend picks them up'), 409
+    body = request.get_data()
+    if not body.strip():
+        return jsonify(error='Empty batch'), 400
+    os.makedirs(INGEST_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}.csv"
+    path = os.path.join(INGEST_DIR, name)
+    with open(path + '.part', 'wb') as f:
+        f.write(body)
+    os.replace(path + '.part', path)
+    rows = ingest_pending()
+    return jsonify(file=name, rows=rows, version=backend.version)
 
-    return fig_gender, fig_ref, fig_scatter
 @app.callback(
-    Output('download-csv', 'data'),
-    Input('btn-download', 'n_clicks'),
-    State('country-filter', 'value'),
-    State('category-filter', 'value'),
-    State('date-range', 'start_date'),
+    Output('country-filter', 'options'),
+    Output('category-filter', 'options'),
+    Output('date-range', 'min_date_allowed'),
+    Output('date-range', 'max_date_allowed'),
+    Output('date-range', 'end_date'),
+    Output('data-version', 'data'),
+    Input('data-refresh', 'n_intervals'),
+    State('data-version', 'data'),
     State('date-range', 'end_date'),
-    prevent_initial_call=True
+    State('date-range', 'max_date_allowed')
 )
-def generate_csv(n_clicks, countries, categories, start_date, end_date):
-    dff = filter_df(df, countries or [], categories or [], start_date, end_date)
-    return dcc.send_data_frame(dff.to_csv, filename='filtered_sales.csv', index=False)
+@metrics.instrumented
+def refresh_data_bounds(n_intervals, version, end_date, max_allowed):
+    d = backend
+    digests = dict(version or {})
+    if digests.get('version') == d.version:
+        return (no_update,) * 6
+    version, countries, categories, (first, last), _ = layout_data()
+    # a range that ended at the newest day keeps following the newest data
+    follows_latest = bool(end_date and max_allowed and str(end_date)[:10] == str(max_allowed)[:10])
+    new_end = last if follows_latest and last is not None and str(last) != str(end_date)[:10] else no_update
+    # options are only re-sent when a batch brought a new country or category
+    country_opts = render_output('country_options', digests, [countries], lambda: countries)
+    category_opts = render_output('category_options', digests, [categories], lambda: categories)
+    digests['version'] = version
+    return country_opts, category_opts, first, last, new_end, digests
+
+# at the end, once every callback and helper the views use is defined
+if FIGURE_CACHE_MAX_MB > 0:
+    t0 = time.perf_counter()
+    print(f'Warmed {warm_figures()} view(s) in {time.perf_counter() - t0:.2f}s')
 
 if __name__ == '__main__':
+    start_ingest_watcher()
     print('Starting colorful Dash app (fixed, no badges) on http://127.0.0.1:7860')
     app.run(debug=False, port=7860, host='0.0.0.0')
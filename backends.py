@@ -0,0 +1,450 @@
+# backends.py
+# Data access behind the dashboard callbacks. A backend answers the questions
+# the charts ask (rollups, distinct customers, per-customer session points,
+# export rows, pages of the orders table) for a normalized filter state: lists
+# of countries and categories plus start/end dates (datetime.date or None).
+#
+#   PandasBackend - the in-memory Dataset (filter index + monthly rollups)
+#   SQLBackend    - DuckDB over Parquet files or a .duckdb database, or SQLite
+#                   over a database file; filters and GROUP BYs run inside the
+#                   engine and only aggregated rows come back to Python, so the
+#                   dataset doesn't have to fit in a worker's memory
+#
+# `python preprocess.py data.csv --sqlite data.db` / `--parquet data.parquet`
+# converts a CSV for the SQL backends.
+
+import glob
+import operator
+import os
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from engine import RollupCube
+from preprocess import with_date_views
+try:
+    import duckdb
+except ImportError:  # only needed for DATA_BACKEND=duckdb
+    duckdb = None
+
+TABLE = 'sales'
+
+# Orders table conditions are (column, op, value) with op one of these or
+# 'contains' (case-insensitive substring); dates come as datetime.date
+COMPARISONS = {'eq': operator.eq, 'ne': operator.ne, 'lt': operator.lt,
+               'le': operator.le, 'gt': operator.gt, 'ge': operator.ge}
+SQL_COMPARISONS = {'eq': '=', 'ne': '!=', 'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>='}
+
+
+def backend_for_path(path):
+    # Default backend for DATA_PATH when DATA_BACKEND isn't set
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.db', '.sqlite', '.sqlite3'):
+        return 'sqlite'
+    if ext in ('.parquet', '.duckdb') or os.path.isdir(path) or glob.has_magic(path):
+        return 'duckdb'
+    return 'pandas'
+
+
+def _user_sessions(frame):
+    # SessionDuration is float32 in the compacted frame; average it in float64
+    frame = frame[['UserID', 'SessionDuration', 'TotalAmount']].astype({'SessionDuration': 'float64'})
+    return frame.groupby('UserID', observed=True).agg(
+        SessionDuration=('SessionDuration', 'mean'), AvgOrderValue=('TotalAmount', 'mean')).reset_index(drop=True)
+
+
+def _condition_mask(values, op, value):
+    if op == 'contains':
+        needle = str(value).lower()
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # test each category once, then look the rows up by code
+            hit = np.append(values.cat.categories.astype(str).str.lower().str.contains(needle, regex=False), False)
+            return hit[values.array.codes]
+        return values.astype(str).str.lower().str.contains(needle, regex=False).to_numpy()
+    if values.dtype.kind == 'M':
+        value = pd.Timestamp(value)
+    elif isinstance(values.dtype, pd.CategoricalDtype) and op not in ('eq', 'ne'):
+        values = values.astype(str)  # unordered categories only compare for equality
+    return COMPARISONS[op](values, value).to_numpy(dtype=bool)
+
+
+class _FrameRows:
+    # The matching rows of an orders table view: a slice of the date-sorted
+    # frame, or row positions in display order once sorted or filtered.
+    # page() costs O(page size) either way.
+    def __init__(self, df, sel):
+        self.df = df
+        self.sel = sel
+
+    def __len__(self):
+        sel = self.sel
+        return sel.stop - sel.start if isinstance(sel, slice) else len(sel)
+
+    @property
+    def nbytes(self):
+        return 64 if isinstance(self.sel, slice) else self.sel.nbytes
+
+    def page(self, offset, limit):
+        sel = self.sel
+        if isinstance(sel, slice):
+            start = min(sel.start + offset, sel.stop)
+            return self.df.iloc[start:min(start + limit, sel.stop)]
+        return self.df.iloc[sel[offset:offset + limit]]
+
+
+class _QueryRows:
+    # The same for a SQL store: the ordered query, run with LIMIT/OFFSET per page
+    nbytes = 64
+
+    def __init__(self, backend, sql, params, total):
+        self.backend = backend
+        self.sql = sql
+        self.params = params
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def page(self, offset, limit):
+        return self.backend._frame(f'{self.sql} LIMIT ? OFFSET ?', self.params + [limit, offset])
+
+
+class PandasBackend:
+    name = 'pandas'
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    @property
+    def version(self):
+        return self.dataset.version
+
+    @property
+    def columns(self):
+        return list(self.dataset.df.columns)
+
+    def rows(self):
+        return len(self.dataset.df)
+
+    def values(self, col):
+        index = self.dataset.index
+        if col in index.dims:
+            return sorted(index.values(col))
+        df = self.dataset.df
+        return sorted(df[col].dropna().unique()) if col in df.columns else []
+
+    def date_span(self):
+        # rows are in PurchaseDate order with undated rows last
+        index = self.dataset.index
+        if not index.n_dated:
+            return None, None
+        return pd.Timestamp(index.dates[0]).date(), pd.Timestamp(index.dates[index.n_dated - 1]).date()
+
+    def append(self, batch):
+        return PandasBackend(self.dataset.append(batch))
+
+    def refresh(self):
+        return False  # changes arrive through append()
+
+    def count(self, countries, categories, start_date, end_date):
+        sel = self.dataset.index.positions(countries, categories, start_date, end_date)
+        return sel.stop - sel.start if isinstance(sel, slice) else len(sel)
+
+    def filtered(self, countries, categories, start_date, end_date):
+        index = self.dataset.index
+        return index.take(index.positions(countries, categories, start_date, end_date))
+
+    def query(self, name, countries, categories, start_date, end_date):
+        return self.dataset.cube.query(name, countries, categories, start_date, end_date)
+
+    def cohorts(self, countries, categories, start_date, end_date, basis='signup'):
+        return self.dataset.cube.cohorts(countries, categories, start_date, end_date, basis)
+
+    def unique_customers(self, countries, categories, start_date, end_date, exact=True):
+        # exact=False uses the cube's HyperLogLog sketches when the Dataset was built with them
+        return self.dataset.cube.unique_customers(countries, categories, start_date, end_date, exact)
+
+    def session_points(self, countries, categories, start_date, end_date, limit=None):
+        # Mean session duration and order value per customer; a fixed sample of `limit` customers
+        cust = _user_sessions(self.filtered(countries, categories, start_date, end_date))
+        if limit is not None and len(cust) > limit:
+            cust = cust.sample(n=limit, random_state=0)
+        return cust
+
+    def session_density(self, countries, categories, start_date, end_date, bins):
+        cust = _user_sessions(self.filtered(countries, categories, start_date, end_date))
+        return np.histogram2d(cust['SessionDuration'].values, cust['AvgOrderValue'].values, bins=bins)
+
+    def table_rows(self, countries, categories, start_date, end_date, sort=(), conditions=()):
+        # sort: ((column, ascending), ...); without sort or conditions the rows
+        # stay in date order and no positions are materialized
+        index = self.dataset.index
+        df = index.df
+        sel = index.positions(countries, categories, start_date, end_date)
+        if not sort and not conditions:
+            return _FrameRows(df, sel)
+        pos = np.arange(sel.start, sel.stop) if isinstance(sel, slice) else sel
+        if conditions:
+            keep = np.ones(len(pos), dtype=bool)
+            for col, op, value in conditions:
+                keep &= _condition_mask(df[col].iloc[pos], op, value)
+            pos = pos[keep]
+        if sort:
+            cols = [c for c, _ in sort]
+            keys = df[cols].iloc[pos]
+            for c in cols:
+                if isinstance(keys[c].dtype, pd.CategoricalDtype):
+                    # categories appended by ingestion aren't in order; sort by value
+                    keys[c] = keys[c].cat.reorder_categories(sorted(keys[c].cat.categories))
+            # the frame has a RangeIndex, so the sorted index is the row positions
+            pos = keys.sort_values(cols, ascending=[asc for _, asc in sort], kind='stable',
+                                   na_position='last').index.to_numpy()
+        return _FrameRows(df, pos)
+
+    def iter_rows(self, countries, categories, start_date, end_date, chunk_rows):
+        index = self.dataset.index
+        sel = index.positions(countries, categories, start_date, end_date)
+        if isinstance(sel, slice):
+            starts = range(sel.start, sel.stop, chunk_rows)
+            chunks = (index.df.iloc[i:min(i + chunk_rows, sel.stop)] for i in starts)
+        else:
+            chunks = (index.df.iloc[sel[i:i + chunk_rows]] for i in range(0, len(sel), chunk_rows))
+        empty = True
+        for chunk in chunks:
+            empty = False
+            yield with_date_views(chunk)  # exports keep the Date/Month columns of the cleaned CSV
+        if empty:
+            yield with_date_views(index.df.iloc[:0])
+
+
+class SQLBackend:
+    # One connection per thread (and per process: connections never cross a
+    # gunicorn fork). SQLite stores dates as ISO text, DuckDB as timestamps.
+    def __init__(self, path, engine):
+        if engine == 'duckdb' and duckdb is None:
+            raise ImportError('DATA_BACKEND=duckdb requires the duckdb package')
+        if engine not in ('duckdb', 'sqlite'):
+            raise ValueError(f'Unknown SQL backend {engine!r}')
+        self.name = engine
+        self.path = path
+        self.version = 0
+        self._local = threading.local()
+        self._stamp = self._store_stamp()
+        self.columns = list(self._frame(f'SELECT * FROM {TABLE} LIMIT 0').columns)
+        self._rows = self._fetch(f'SELECT COUNT(*) FROM {TABLE}')[0][0]
+
+    def _store_files(self):
+        if os.path.isdir(self.path):
+            return glob.glob(os.path.join(self.path, '**', '*.parquet'), recursive=True)
+        if glob.has_magic(self.path):
+            return glob.glob(self.path)
+        return [p for p in (self.path, self.path + '-wal') if os.path.exists(p)]
+
+    def _store_stamp(self):
+        files = self._store_files()
+        return len(files), max((os.path.getmtime(f) for f in files), default=0)
+
+    def _connect(self):
+        local = self._local
+        if getattr(local, 'pid', None) == os.getpid():
+            return local.con
+        if self.name == 'sqlite':
+            con = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        elif self.path.lower().endswith('.duckdb'):
+            con = duckdb.connect(self.path, read_only=True)
+        else:
+            con = duckdb.connect()
+            source = os.path.join(self.path, '**', '*.parquet') if os.path.isdir(self.path) else self.path
+            # sales_rows also carries each row's file and position: a unique key for paging
+            con.execute(f"CREATE VIEW {TABLE}_rows AS SELECT * FROM read_parquet('{source}', filename=true, file_row_number=true)")
+            con.execute(f'CREATE VIEW {TABLE} AS SELECT * EXCLUDE (filename, file_row_number) FROM {TABLE}_rows')
+        if self.name == 'duckdb' and os.environ.get('DUCKDB_MEMORY_LIMIT'):
+            con.execute(f"SET memory_limit = '{os.environ['DUCKDB_MEMORY_LIMIT']}'")
+        local.pid, local.con = os.getpid(), con
+        return con
+
+    def _fetch(self, sql, params=()):
+        return self._connect().execute(sql, params).fetchall()
+
+    def _frame(self, sql, params=()):
+        cur = self._connect().execute(sql, params)
+        if self.name == 'duckdb':
+            return cur.fetchdf()
+        return pd.DataFrame(cur.fetchall(), columns=[d[0] for d in cur.description])
+
+    def _date(self, d):
+        return d.isoformat() if self.name == 'sqlite' else d
+
+    def _floor(self, expr):
+        # bin numbers are never negative, so truncation is a floor in SQLite
+        return f'CAST({expr} AS INTEGER)' if self.name == 'sqlite' else f'CAST(floor({expr}) AS INTEGER)'
+
+    def _where(self, countries, categories, start_date, end_date):
+        clauses, params = [], []
+        for col, values in (('Country', countries), ('Category', categories)):
+            if values:
+                clauses.append(f'"{col}" IN ({", ".join("?" * len(values))})')
+                params += list(values)
+        if start_date is not None:
+            clauses.append('"Date" >= ?')
+            params.append(self._date(start_date))
+        if end_date is not None:
+            clauses.append('"Date" <= ?')
+            params.append(self._date(end_date))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def refresh(self):
+        # True (and a new version) when the database or Parquet files changed on disk
+        stamp = self._store_stamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        self._local = threading.local()  # reopen: DuckDB views and SQLite snapshots see the new files
+        self._rows = self._fetch(f'SELECT COUNT(*) FROM {TABLE}')[0][0]
+        self.version += 1
+        return True
+
+    def rows(self):
+        return self._rows
+
+    def values(self, col):
+        if col not in self.columns:
+            return []
+        return [v for v, in self._fetch(f'SELECT DISTINCT "{col}" FROM {TABLE} WHERE "{col}" IS NOT NULL ORDER BY 1')]
+
+    def date_span(self):
+        if 'Date' not in self.columns:
+            return None, None
+        first, last = self._fetch(f'SELECT MIN("Date"), MAX("Date") FROM {TABLE}')[0]
+        if first is None:
+            return None, None
+        return pd.Timestamp(first).date(), pd.Timestamp(last).date()
+
+    def count(self, countries, categories, start_date, end_date):
+        where, params = self._where(countries, categories, start_date, end_date)
+        return self._fetch(f'SELECT COUNT(*) FROM {TABLE}{where}', params)[0][0]
+
+    def query(self, name, countries, categories, start_date, end_date):
+        dims = ['Month'] + [c for c in RollupCube.ROLLUPS[name] if c in self.columns]
+        cols = ', '.join(f'"{c}"' for c in dims)
+        where, params = self._where(countries, categories, start_date, end_date)
+        frame = self._frame(f'SELECT {cols}, SUM("TotalAmount") AS "TotalAmount", COUNT(*) AS "Orders" '
+                            f'FROM {TABLE}{where} GROUP BY {cols}', params)
+        frame['Month'] = pd.to_datetime(frame['Month'])
+        return frame.astype({'TotalAmount': 'float64', 'Orders': 'int64'})
+
+    def unique_customers(self, countries, categories, start_date, end_date, exact=True):
+        # Always exact: the engine counts inside the database (DuckDB's approx_count_distinct
+        # is too coarse for a KPI, ~10% off on a few thousand users)
+        where, params = self._where(countries, categories, start_date, end_date)
+        return int(self._fetch(f'SELECT COUNT(DISTINCT "UserID") FROM {TABLE}{where}', params)[0][0])
+
+    def _month_number(self, expr):
+        # months since 1970-01, as engine.month_numbers
+        if self.name == 'sqlite':
+            return f"((CAST(strftime('%Y', {expr}) AS INTEGER) - 1970) * 12 + CAST(strftime('%m', {expr}) AS INTEGER) - 1)"
+        return f'((year({expr}) - 1970) * 12 + month({expr}) - 1)'
+
+    def cohorts(self, countries, categories, start_date, end_date, basis='signup'):
+        # Same frame as RollupCube.cohorts: monthly revenue per customer within
+        # the filter, joined to each customer's cohort month over all rows
+        where, params = self._where(countries, categories, start_date, end_date)
+        where = (where + ' AND ' if where else ' WHERE ') + '"UserID" IS NOT NULL AND "Month" IS NOT NULL'
+        month = self._month_number('"Month"')
+        cohort_col = '"SignUpDate"' if basis == 'signup' else '"Month"'
+        cohorts = (f'SELECT "UserID", MIN({self._month_number(cohort_col)}) AS cohort FROM {TABLE} '
+                   f'WHERE {cohort_col} IS NOT NULL GROUP BY "UserID"')
+        active = (f'SELECT a."UserID", a.m, a.revenue, c.cohort FROM ('
+                  f'SELECT "UserID", {month} AS m, SUM("TotalAmount") AS revenue FROM {TABLE}{where} GROUP BY 1, 2'
+                  f') AS a JOIN ({cohorts}) AS c ON a."UserID" = c."UserID" WHERE a.m >= c.cohort')
+        cells = self._frame(f'SELECT cohort, m - cohort AS since, COUNT(*) AS customers, SUM(revenue) AS revenue '
+                            f'FROM ({active}) AS t GROUP BY 1, 2 ORDER BY 1, 2', params)
+        sizes = self._frame(f'SELECT cohort, COUNT(DISTINCT "UserID") AS size FROM ({active}) AS t GROUP BY 1', params)
+        cells = cells.merge(sizes, on='cohort', how='left')
+        return pd.DataFrame({
+            'Cohort': cells['cohort'].to_numpy(dtype=np.int64).astype('datetime64[M]').astype('datetime64[ns]'),
+            'MonthsSince': cells['since'].to_numpy(dtype=np.int64),
+            'Customers': cells['customers'].to_numpy(dtype=np.int64),
+            'Revenue': cells['revenue'].fillna(0).to_numpy(dtype=np.float64),
+            'CohortCustomers': cells['size'].to_numpy(dtype=np.int64),
+        })
+
+    def _sessions_sql(self, where):
+        return (f'SELECT "UserID", AVG("SessionDuration") AS "SessionDuration", AVG("TotalAmount") AS "AvgOrderValue" '
+                f'FROM {TABLE}{where} GROUP BY "UserID"')
+
+    def session_points(self, countries, categories, start_date, end_date, limit=None):
+        # Every k-th customer by UserID when there are more than `limit`
+        where, params = self._where(countries, categories, start_date, end_date)
+        if limit is None:
+            return self._frame(f'SELECT "SessionDuration", "AvgOrderValue" FROM ({self._sessions_sql(where)}) AS u', params)
+        n = self.unique_customers(countries, categories, start_date, end_date)
+        step = max(n // limit, 1)
+        return self._frame(f'SELECT "SessionDuration", "AvgOrderValue" FROM ('
+                           f'SELECT *, ROW_NUMBER() OVER (ORDER BY "UserID") AS rn FROM ({self._sessions_sql(where)}) AS u'
+                           f') AS s WHERE rn % ? = 0 LIMIT ?', params + [step, limit])
+
+    def session_density(self, countries, categories, start_date, end_date, bins):
+        # Same bins as np.histogram2d: equal widths over the value range, the last bin closed
+        # (a point sitting exactly on an edge may land one bin over)
+        where, params = self._where(countries, categories, start_date, end_date)
+        sessions = self._sessions_sql(where)
+        x0, x1, y0, y1 = self._fetch(f'SELECT MIN("SessionDuration"), MAX("SessionDuration"), '
+                                     f'MIN("AvgOrderValue"), MAX("AvgOrderValue") FROM ({sessions}) AS u', params)[0]
+        counts = np.zeros((bins, bins))
+        if x0 is None or y0 is None:
+            return counts, np.linspace(0, 1, bins + 1), np.linspace(0, 1, bins + 1)
+        x0, x1 = (x0 - 0.5, x1 + 0.5) if x0 == x1 else (x0, x1)
+        y0, y1 = (y0 - 0.5, y1 + 0.5) if y0 == y1 else (y0, y1)
+        xb = self._floor(f'("SessionDuration" - {x0!r}) / {(x1 - x0) / bins!r}')
+        yb = self._floor(f'("AvgOrderValue" - {y0!r}) / {(y1 - y0) / bins!r}')
+        cells = self._fetch(f'SELECT CASE WHEN xb >= {bins} THEN {bins - 1} ELSE xb END, '
+                            f'CASE WHEN yb >= {bins} THEN {bins - 1} ELSE yb END, COUNT(*) FROM ('
+                            f'SELECT {xb} AS xb, {yb} AS yb FROM ({sessions}) AS u '
+                            f'WHERE "SessionDuration" IS NOT NULL AND "AvgOrderValue" IS NOT NULL) AS b GROUP BY 1, 2', params)
+        for i, j, c in cells:
+            counts[i, j] += c
+        return counts, np.linspace(x0, x1, bins + 1), np.linspace(y0, y1, bins + 1)
+
+    def table_rows(self, countries, categories, start_date, end_date, sort=(), conditions=()):
+        # Ties are broken by date, user and product so pages don't overlap
+        where, params = self._where(countries, categories, start_date, end_date)
+        clauses = []
+        for col, op, value in conditions:
+            if op == 'contains':
+                needle = str(value).lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                clauses.append(f'lower(CAST("{col}" AS VARCHAR)) LIKE ? ESCAPE \'\\\'')
+                params.append(f'%{needle}%')
+            else:
+                clauses.append(f'"{col}" {SQL_COMPARISONS[op]} ?')
+                params.append(self._date(value) if hasattr(value, 'isoformat') else value)
+        if clauses:
+            where = (where + ' AND ' if where else ' WHERE ') + ' AND '.join(clauses)
+        order = [f'"{c}" {"ASC" if asc else "DESC"} NULLS LAST' for c, asc in sort]
+        order += [f'"{c}"' for c in ('PurchaseDate', 'UserID', 'ProductName') if c in self.columns and c not in dict(sort)]
+        # then a unique key, so LIMIT/OFFSET pages never overlap or skip tied rows:
+        # rowid for SQLite and DuckDB tables, file and position for Parquet
+        if self.name == 'duckdb' and not self.path.lower().endswith('.duckdb'):
+            source, order = f'{TABLE}_rows', order + ['filename', 'file_row_number']
+        else:
+            source, order = TABLE, order + ['rowid']
+        total = self._fetch(f'SELECT COUNT(*) FROM {TABLE}{where}', params)[0][0]
+        cols = ', '.join(f'"{c}"' for c in self.columns)
+        return _QueryRows(self, f'SELECT {cols} FROM {source}{where} ORDER BY {", ".join(order)}', params, total)
+
+    def iter_rows(self, countries, categories, start_date, end_date, chunk_rows):
+        where, params = self._where(countries, categories, start_date, end_date)
+        cur = self._connect().cursor() if self.name == 'duckdb' else self._connect()
+        order = ' ORDER BY "Date"' if 'Date' in self.columns else ''  # the pandas path exports in date order too
+        cur = cur.execute(f'SELECT * FROM {TABLE}{where}{order}', params)
+        columns = [d[0] for d in cur.description]
+        if self.name == 'duckdb':
+            chunks = (batch.to_pandas() for batch in cur.fetch_record_batch(chunk_rows))
+        else:
+            chunks = (pd.DataFrame(rows, columns=columns) for rows in iter(lambda: cur.fetchmany(chunk_rows), []))
+        empty = True
+        for chunk in chunks:
+            empty = False
+            yield chunk
+        if empty:
+            yield pd.DataFrame(columns=columns)
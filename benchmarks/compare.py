@@ -0,0 +1,69 @@
+# benchmarks/compare.py
+# Usage: python benchmarks/compare.py BASELINE.json CURRENT.json [--threshold 1.25] [--memory-threshold 1.25]
+#
+# Matches the measurements of two benchmarks/run.py result files and prints the
+# ratio current / baseline for each. Exits with status 1 when any latency
+# (p50 by default) or peak RSS grew by more than its threshold, so it can gate
+# a change in CI.
+
+import argparse
+import json
+import sys
+
+
+def measurements(report, metric):
+    # (rows, kind, name, scenario, mode) -> value, for everything both files can share
+    out = {}
+    for size in report['sizes']:
+        rows = size['rows']
+        for mode in ('cold', 'warm'):
+            startup = size.get('startup', {}).get(mode)
+            if startup:
+                out[(rows, 'startup', 'import app', '', mode)] = ('s', startup['seconds'])
+        for cb in size.get('callbacks', []):
+            out[(rows, 'callback', cb['callback'], cb['scenario'], cb['cache'])] = ('ms', cb[metric])
+        for ex in size.get('export', []):
+            out[(rows, 'export', ex['format'], ex['scenario'], '')] = ('ms', ex[metric])
+        if 'peak_rss_mb' in size:
+            out[(rows, 'memory', 'peak RSS', '', '')] = ('MB', size['peak_rss_mb'])
+    return out
+
+
+def compare(baseline, current, metric='p50_ms', threshold=1.25, memory_threshold=1.25):
+    base = measurements(baseline, metric)
+    cur = measurements(current, metric)
+    regressions = []
+    print(f"{'rows':>11}  {'kind':<8} {'name':<28} {'scenario':<26} {'mode':<5} {'baseline':>12} {'current':>12}  ratio")
+    for key in sorted(base.keys() & cur.keys(), key=lambda k: tuple(str(p) for p in k)):
+        unit, before = base[key]
+        after = cur[key][1]
+        ratio = after / before if before else float('inf')
+        limit = memory_threshold if key[1] == 'memory' else threshold
+        flag = '  REGRESSION' if ratio > limit else ''
+        if flag:
+            regressions.append(key)
+        rows, kind, name, scenario, mode = key
+        print(f'{rows:>11,}  {kind:<8} {name:<28} {scenario:<26} {mode:<5} {before:>9.1f} {unit:<2} {after:>9.1f} {unit:<2}  {ratio:5.2f}{flag}')
+    missing = sorted(base.keys() - cur.keys(), key=str)
+    if missing:
+        print(f'{len(missing)} baseline measurement(s) missing from the current run')
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--metric', default='p50_ms', choices=['p50_ms', 'p99_ms', 'mean_ms', 'min_ms'])
+    parser.add_argument('--threshold', type=float, default=1.25, help='allowed latency ratio (current / baseline)')
+    parser.add_argument('--memory-threshold', type=float, default=1.25, help='allowed peak RSS ratio')
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.metric, args.threshold, args.memory_threshold)
+    if regressions:
+        print(f'{len(regressions)} regression(s) above the threshold')
+        sys.exit(1)
+    print('No regressions')
@@ -0,0 +1,119 @@
+# benchmarks/generate.py
+# Usage: python benchmarks/generate.py ROWS OUT.csv [--users N] [--countries N] ...
+#
+# Writes a synthetic dataset with the columns of ecommerce_synthetic_dataset.csv
+# (dates as dd-mm-YYYY, like the real file). Rows are generated and written in
+# chunks, so memory stays flat whatever the row count; the same arguments and
+# seed always produce the same file.
+
+import argparse
+import os
+import numpy as np
+import pandas as pd
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pandas' writer is ~15x slower but produces the same data
+    pa = pa_csv = None
+
+COUNTRIES = ['India', 'United States', 'Germany', 'France', 'Brazil', 'Japan', 'Canada', 'Australia',
+             'United Kingdom', 'Italy', 'Spain', 'Mexico', 'Netherlands', 'Sweden', 'South Africa', 'Singapore']
+CATEGORIES = {
+    'Electronics': ['Phone', 'Laptop', 'Tablet', 'Headphones', 'Camera'],
+    'Clothing': ['Shirt', 'Jeans', 'Jacket', 'Shoes', 'Dress'],
+    'Home': ['Lamp', 'Chair', 'Table', 'Sofa', 'Rug'],
+    'Books': ['Novel', 'Comic', 'Cookbook', 'Biography', 'Textbook'],
+}
+GENDERS = ['Male', 'Female', 'Other']
+REFERRALS = ['Google', 'Facebook', 'Email', 'Direct', 'Instagram']
+DEVICES = ['Mobile', 'Desktop', 'Tablet']
+
+
+def _names(base, n, prefix):
+    # the real names first, then numbered ones for higher cardinalities
+    return list(base[:n]) + [f'{prefix} {i}' for i in range(len(base) + 1, n + 1)]
+
+
+def _day_labels(start, days):
+    return pd.date_range(start, periods=days, freq='D').strftime('%d-%m-%Y').to_numpy()
+
+
+def generate_chunk(rng, n, users, countries, categories, products, purchase_days, signup_days, missing_rate):
+    # products[i, j] is the j-th product of categories[i]; a user keeps one gender and sign-up date
+    cat = rng.integers(0, len(categories), n)
+    user = rng.integers(0, users, n)
+    frame = pd.DataFrame({
+        'UserID': np.char.add('U', user.astype(str)),
+        'UserName': np.char.add('user', user.astype(str)),
+        'Gender': np.asarray(GENDERS)[user % len(GENDERS)],
+        'Country': np.asarray(countries, dtype=object)[rng.integers(0, len(countries), n)],
+        'SignUpDate': signup_days[user % len(signup_days)],
+        'PurchaseDate': purchase_days[rng.integers(0, len(purchase_days), n)],
+        'ProductName': products[cat, rng.integers(0, products.shape[1], n)],
+        'Category': np.asarray(categories)[cat],
+        'Price': rng.uniform(5, 500, n).round(2),
+        'Quantity': rng.integers(1, 6, n),
+        'DeviceType': np.asarray(DEVICES)[rng.integers(0, len(DEVICES), n)],
+        'ReferralSource': np.asarray(REFERRALS)[rng.integers(0, len(REFERRALS), n)],
+        'SessionDuration': rng.gamma(2.0, 8.0, n).round(1),
+    })
+    if missing_rate > 0:
+        frame.loc[rng.random(n) < missing_rate, 'Country'] = np.nan
+    return frame
+
+
+def write_csv(path, rows, users=None, countries=8, categories=4, products_per_category=5, days=1095,
+              start='2022-01-01', missing_rate=0.01, seed=0, chunk_rows=1_000_000):
+    users = users or max(rows // 5, 1)
+    country_names = _names(COUNTRIES, countries, 'Country')
+    category_names = _names(list(CATEGORIES), categories, 'Category')
+    products = np.asarray([_names(CATEGORIES.get(c, []), products_per_category, f'{c} item') for c in category_names])
+    purchase_days = _day_labels(start, days)
+    signup_days = _day_labels(pd.Timestamp(start) - pd.Timedelta(days=730), 730 + days)
+    rng = np.random.default_rng(seed)
+    tmp = f'{path}.part'
+    written = 0
+    writer = None
+    with open(tmp, 'wb') as f:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            chunk = generate_chunk(rng, n, users, country_names, category_names, products,
+                                   purchase_days, signup_days, missing_rate)
+            if pa_csv is not None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pa_csv.CSVWriter(f, table.schema)
+                writer.write_table(table)
+            else:
+                f.write(chunk.to_csv(index=False, header=written == 0).encode())
+            written += n
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, path)
+    return path
+
+
+def add_arguments(parser):
+    parser.add_argument('--users', type=int, default=None, help='distinct UserIDs (default rows / 5)')
+    parser.add_argument('--countries', type=int, default=8)
+    parser.add_argument('--categories', type=int, default=4)
+    parser.add_argument('--products-per-category', type=int, default=5)
+    parser.add_argument('--days', type=int, default=1095, help='span of PurchaseDate in days')
+    parser.add_argument('--missing-rate', type=float, default=0.01, help='share of rows without a Country')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def generator_options(args):
+    return dict(users=args.users, countries=args.countries, categories=args.categories,
+                products_per_category=args.products_per_category, days=args.days,
+                missing_rate=args.missing_rate, seed=args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic e-commerce dataset.')
+    parser.add_argument('rows', type=float, help='number of rows, e.g. 1e6')
+    parser.add_argument('out', help='output CSV path')
+    add_arguments(parser)
+    args = parser.parse_args()
+    write_csv(args.out, int(args.rows), **generator_options(args))
+    print(f'Wrote {int(args.rows):,} rows to {args.out}')
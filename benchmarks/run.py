@@ -0,0 +1,244 @@
+# benchmarks/run.py
+# Usage: python benchmarks/run.py [--rows 1e5 1e6] [--repeat 20] [--backend pandas|sqlite|duckdb] [--out results.json]
+#
+# For every dataset size this generates (or reuses) a synthetic CSV, then
+# measures in fresh child processes:
+#   - startup: importing app from the CSV (cold, also writes the snapshot) and
+#     from the snapshot (warm)
+#   - every callback, called directly, over a matrix of filter selectivities,
+#     with the filter cache cleared before each call (cold) and kept (warm)
+#   - the CSV export, streamed from /export to the last byte
+# and writes p50/p99 latency, throughput and peak RSS to one JSON file.
+# With --backend sqlite/duckdb the CSV is first converted with preprocess.py
+# (to .db / .parquet next to it) and the app is pointed at that store.
+# Compare two result files with benchmarks/compare.py.
+#
+# 1e7 rows and above need several GB of memory: the whole dataset is loaded the
+# same way the app loads it in production.
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from generate import add_arguments, generator_options, write_csv  # noqa: E402
+
+CALLBACKS = ['update_dashboard', 'render_heavy_charts', 'update_orders_table', 'update_cohorts']
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(seconds, rows=None):
+    ms = np.asarray(seconds) * 1000
+    mean_s = float(np.mean(seconds))
+    out = {'calls': len(ms), 'p50_ms': float(np.percentile(ms, 50)), 'p99_ms': float(np.percentile(ms, 99)),
+           'mean_ms': float(ms.mean()), 'min_ms': float(ms.min()), 'calls_per_s': 1 / mean_s if mean_s else None}
+    if rows is not None:
+        out['rows_per_s'] = rows / mean_s if mean_s else None
+    return out
+
+
+def scenarios(app):
+    # Filter states from wide to narrow, in the form the browser sends them
+    backend = app.backend
+    first, last = backend.date_span()
+    country = max(backend.values('Country'), key=lambda c: backend.count([c], [], None, None))
+    category = max(backend.values('Category'), key=lambda c: backend.count([], [c], None, None))
+    month_start = max(first, last - timedelta(days=29))
+    return {
+        'all': ([], [], first.isoformat(), last.isoformat()),
+        'one_category': ([], [category], first.isoformat(), last.isoformat()),
+        'one_country': ([country], [], first.isoformat(), last.isoformat()),
+        'last_30_days': ([], [], month_start.isoformat(), last.isoformat()),
+        'country_category_30_days': ([country], [category], month_start.isoformat(), last.isoformat()),
+    }
+
+
+def child_startup(args):
+    t0 = time.perf_counter()
+    import app
+    return {'seconds': time.perf_counter() - t0, 'rows': app.backend.rows(), 'peak_rss_mb': peak_rss_mb()}
+
+
+def clear_caches(app):
+    app.filter_cache.clear()
+    figure_cache = getattr(app, 'figure_cache', None)
+    if figure_cache is not None:
+        figure_cache.clear()
+
+
+def child_run(args):
+    import app
+    total = app.backend.rows()
+    result = {'rows': total, 'rss_after_load_mb': peak_rss_mb(), 'scenarios': {}, 'callbacks': [], 'export': []}
+    states = scenarios(app)
+    if args.scenarios:
+        states = {name: states[name] for name in args.scenarios}
+    for scenario, state in states.items():
+        matching = app.backend.count(*app.filter_state(*state))
+        result['scenarios'][scenario] = {'state': state, 'rows': matching, 'selectivity': matching / total if total else 0}
+        for name in CALLBACKS:
+            func = getattr(app, name, None)
+            if func is None:
+                continue
+            for cache in ('cold', 'warm'):
+                clear_caches(app)
+                func(*state)  # first call: imports, plotly validators
+                timings = []
+                for _ in range(args.repeat):
+                    if cache == 'cold':
+                        clear_caches(app)
+                    t0 = time.perf_counter()
+                    func(*state)
+                    timings.append(time.perf_counter() - t0)
+                result['callbacks'].append({'callback': name, 'scenario': scenario, 'cache': cache,
+                                            **summarize(timings, matching)})
+        if args.export_repeat:
+            client = app.server.test_client()
+            url = '/export?' + app.export_query(*state)
+            timings, size = [], 0
+            for _ in range(args.export_repeat):
+                t0 = time.perf_counter()
+                resp = client.get(url, buffered=False)
+                size = sum(len(chunk) for chunk in resp.response)
+                resp.close()
+                timings.append(time.perf_counter() - t0)
+            stats = summarize(timings, matching)
+            stats['bytes'] = size
+            stats['mb_per_s'] = size / (1024 * 1024) / np.mean(timings)
+            result['export'].append({'format': 'csv.gz', 'scenario': scenario, **stats})
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def run_child(mode, data_path, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'result.json')
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', mode, '--data', data_path, '--result', out,
+               '--repeat', str(args.repeat), '--export-repeat', str(args.export_repeat)]
+        if args.scenarios:
+            cmd += ['--scenarios'] + args.scenarios
+        env = dict(os.environ, DATA_PATH=data_path, DATA_BACKEND=args.backend, INGEST_DIR=os.path.join(tmp, 'incoming'),
+                   INGEST_POLL_SECONDS='0', PROFILE_SLOW_MS='0')
+        subprocess.run(cmd, cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        with open(out) as f:
+            return json.load(f)
+
+
+def dataset_path(data_dir, rows, options):
+    digest = hashlib.sha1(json.dumps(options, sort_keys=True).encode()).hexdigest()[:8]
+    return os.path.join(data_dir, f'synthetic-{rows}-{digest}.csv')
+
+
+def backend_store(csv_path, backend):
+    # The data file the app reads for a backend, converted from the CSV on first use
+    if backend == 'pandas':
+        return csv_path
+    sys.path.insert(0, ROOT)
+    from preprocess import write_parquet, write_sqlite
+    ext, write = ('.db', write_sqlite) if backend == 'sqlite' else ('.parquet', write_parquet)
+    store = os.path.splitext(csv_path)[0] + ext
+    if not os.path.exists(store) or os.path.getmtime(store) < os.path.getmtime(csv_path):
+        print(f'Converting {csv_path} -> {store}')
+        write(csv_path, store)
+    return store
+
+
+def metadata(args):
+    def version(module):
+        try:
+            return __import__(module).__version__
+        except Exception:
+            return None
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'packages': {m: version(m) for m in ('numpy', 'pandas', 'plotly', 'dash', 'pyarrow', 'duckdb')},
+        'args': {k: v for k, v in vars(args).items() if k not in ('child', 'data', 'result')},
+    }
+
+
+def main(args):
+    os.makedirs(args.data_dir, exist_ok=True)
+    options = generator_options(args)
+    report = {'meta': metadata(args), 'sizes': []}
+    for rows in (int(float(r)) for r in args.rows):
+        path = dataset_path(args.data_dir, rows, options)
+        entry = {'rows': rows, 'dataset': os.path.relpath(path, ROOT), 'generator': options, 'backend': args.backend}
+        if not os.path.exists(path):
+            print(f'Generating {rows:,} rows -> {path}')
+            t0 = time.perf_counter()
+            write_csv(path, rows, **options)
+            entry['generate_s'] = time.perf_counter() - t0
+        store = backend_store(path, args.backend)
+
+        shutil.rmtree(os.path.splitext(path)[0] + '.snapshot', ignore_errors=True)
+        print(f'[{rows:,}] startup')
+        entry['startup'] = {'cold': run_child('startup', store, args), 'warm': run_child('startup', store, args)}
+        print(f'[{rows:,}] callbacks and export')
+        entry.update(run_child('run', store, args))
+        report['sizes'].append(entry)
+
+        for cb in entry['callbacks']:
+            print(f"  {cb['callback']:<28} {cb['scenario']:<26} {cb['cache']:<5} p50 {cb['p50_ms']:8.1f} ms  p99 {cb['p99_ms']:8.1f} ms")
+        for ex in entry['export']:
+            print(f"  {'export ' + ex['format']:<28} {ex['scenario']:<26} {'':<5} p50 {ex['p50_ms']:8.1f} ms  {ex['rows_per_s']:,.0f} rows/s")
+        print(f"  startup cold {entry['startup']['cold']['seconds']:.2f} s, warm {entry['startup']['warm']['seconds']:.2f} s, "
+              f"peak RSS {entry['peak_rss_mb']:,.0f} MB")
+
+    out = args.out or os.path.join(HERE, 'results', datetime.now().strftime('%Y%m%dT%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {out}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark startup, callbacks and export on synthetic data.')
+    parser.add_argument('--rows', nargs='+', default=['1e5', '1e6'], help='dataset sizes, e.g. 1e5 1e6 1e7')
+    parser.add_argument('--repeat', type=int, default=20, help='timed calls per callback, scenario and cache mode')
+    parser.add_argument('--export-repeat', type=int, default=3, help='timed exports per scenario (0 skips the export)')
+    parser.add_argument('--scenarios', nargs='+', default=None,
+                        help='subset of: all one_category one_country last_30_days country_category_30_days')
+    parser.add_argument('--backend', choices=['pandas', 'sqlite', 'duckdb'], default='pandas',
+                        help='query backend the app runs on (DATA_BACKEND)')
+    parser.add_argument('--data-dir', default=os.path.join(HERE, 'data'), help='where generated CSVs are kept')
+    parser.add_argument('--out', default=None, help='result file (default benchmarks/results/<timestamp>.json)')
+    add_arguments(parser)
+    parser.add_argument('--child', choices=['startup', 'run'], help=argparse.SUPPRESS)
+    parser.add_argument('--data', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        result = (child_startup if args.child == 'startup' else child_run)(args)
+        with open(args.result, 'w') as f:
+            json.dump(result, f)
+    else:
+        main(args)
@@ -0,0 +1,652 @@
+# engine.py
+# Load-time indexes over the dashboard dataset so filter callbacks never scan
+# or copy the full frame.
+
+import numpy as np
+import pandas as pd
+
+DAY = np.timedelta64(1, 'D')
+
+
+def _clip(positions, lo, hi):
+    # positions are sorted, so a row range is two binary searches
+    return positions[np.searchsorted(positions, lo):np.searchsorted(positions, hi)]
+
+
+def _value_positions(codes, n_values, offset=0):
+    # sorted row positions of every category code; missing values (-1) are skipped
+    order = np.argsort(codes, kind='stable')
+    if offset:
+        order += offset
+    counts = np.bincount(codes[codes >= 0], minlength=n_values)
+    offsets = np.concatenate([[0], np.cumsum(counts)]) + int((codes < 0).sum())
+    return [order[offsets[i]:offsets[i + 1]] for i in range(n_values)]
+
+
+def _with_categories(frame, df):
+    # Re-wrap frame's categorical columns with df's (extended) categories; the
+    # codes stay valid because new categories are only ever appended
+    changed = {c: pd.Categorical.from_codes(frame[c].array.codes, dtype=df[c].dtype, validate=False)
+               for c in frame.columns
+               if isinstance(frame[c].dtype, pd.CategoricalDtype) and c in df.columns and frame[c].dtype != df[c].dtype}
+    return frame.assign(**changed) if changed else frame
+
+
+CAST_CHUNK_ROWS = 1 << 20  # bounds the temporaries of the checks below
+FLOAT32_DECIMALS = 7  # float32 holds about 7 significant digits
+
+
+def float32_decimals(values):
+    # float32 -> float64 through each value's shortest decimal form (up to
+    # FLOAT32_DECIMALS places), so 198.95 widens to 198.95 rather than
+    # 198.9499969482422: the first rounding that maps back to the same float32
+    values = np.asarray(values, dtype=np.float32)
+    out = values.astype(np.float64)
+    for start in range(0, len(values), CAST_CHUNK_ROWS):
+        narrow = values[start:start + CAST_CHUNK_ROWS]
+        wide = out[start:start + CAST_CHUNK_ROWS]  # a view: written in place
+        raw = wide.copy()
+        done = ~np.isfinite(narrow)
+        for k in range(FLOAT32_DECIMALS + 1):
+            if done.all():
+                break
+            rounded = np.round(raw, k)
+            ok = ~done & (rounded.astype(np.float32) == narrow)
+            np.copyto(wide, rounded, where=ok)
+            done |= ok
+    return out
+
+
+def casts_losslessly(values, dtype):
+    # True when values survive conversion to dtype: integers within range,
+    # floats whose shortest decimal form is the same at the narrower width
+    # (so 302.28 fits float32 while 1e10 + 0.5 doesn't)
+    values = np.asarray(values)
+    dtype = np.dtype(dtype)
+    if values.dtype == dtype or not len(values):
+        return True
+    if dtype.kind in 'iu':
+        if values.dtype.kind not in 'iu':
+            return False
+        info = np.iinfo(dtype)
+        return bool(values.min() >= info.min and values.max() <= info.max)
+    if dtype.kind == 'f' and values.dtype.kind in 'iuf':
+        if values.dtype.kind == 'f' and values.dtype.itemsize <= dtype.itemsize:
+            return True
+        for start in range(0, len(values), CAST_CHUNK_ROWS):
+            chunk = values[start:start + CAST_CHUNK_ROWS]
+            with np.errstate(over='ignore'):  # out of range becomes inf, which then differs
+                back = chunk.astype(dtype)
+            if dtype == np.float32:
+                back = float32_decimals(back)
+            same = back == chunk
+            if values.dtype.kind == 'f':
+                same |= np.isnan(back) & np.isnan(chunk)
+            if not same.all():
+                return False
+        return True
+    return False
+
+
+def align_batch(df, batch):
+    # Give a cleaned batch the columns and dtypes of df. Categorical columns get
+    # the union of both category sets with the existing categories first, so
+    # codes already stored in df (and in the indexes built on it) keep their
+    # meaning. Returns (df, batch) with matching dtypes.
+    batch = batch.reindex(columns=df.columns)
+    recoded = {}
+    for c in df.columns:
+        dtype = df[c].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            values = batch[c].astype(object)
+            new = pd.Index(values.dropna().unique()).difference(dtype.categories, sort=False)
+            if len(new):
+                dtype = pd.CategoricalDtype(pd.Index(list(dtype.categories) + list(new)))
+                recoded[c] = pd.Categorical.from_codes(df[c].array.codes, dtype=dtype, validate=False)
+            batch[c] = pd.Categorical(values, dtype=dtype)
+        elif batch[c].dtype != dtype:
+            if dtype.kind in 'iuf' and batch[c].dtype.kind in 'iuf' and not casts_losslessly(batch[c].values, dtype):
+                # a compacted column too narrow for the new values is widened, never wrapped
+                wider = (np.dtype(t) for t in (np.int16, np.int32, np.float64))
+                dtype = next((t for t in wider if t.kind == dtype.kind and t.itemsize > dtype.itemsize
+                              and casts_losslessly(batch[c].values, t)), np.promote_types(dtype, batch[c].dtype))
+                # float32 goes through its shortest decimal form, so 198.95 stays 198.95
+                if df[c].dtype == np.float32 and dtype == np.float64:
+                    recoded[c] = pd.Series(float32_decimals(df[c].values), index=df.index, name=c)
+                else:
+                    recoded[c] = df[c].astype(dtype)
+            try:
+                batch[c] = batch[c].astype(dtype)
+            except (TypeError, ValueError):
+                pass
+    if recoded:
+        df = df.assign(**recoded)
+    return df, batch
+
+
+class FilterIndex:
+    # Rows are sorted by `date_col` (NaT last) so a date range is a contiguous
+    # slice found with searchsorted. Each dimension is stored as a categorical
+    # with the sorted row positions of every value, so a value filter costs
+    # O(matching rows) instead of O(all rows).
+
+    def __init__(self, df, date_col='PurchaseDate', dims=('Country', 'Category')):
+        dates = df[date_col].values
+        nat = np.isnat(dates)
+        n_dated = int(len(dates) - nat.sum())
+        if nat[:n_dated].any() or (dates[1:n_dated] < dates[:n_dated - 1]).any():
+            df = df.take(np.argsort(dates, kind='stable'))
+        if not df.index.equals(pd.RangeIndex(len(df))):
+            df = df.reset_index(drop=True)
+        for c in dims:
+            if c in df.columns and not isinstance(df[c].dtype, pd.CategoricalDtype):
+                df[c] = df[c].astype('category')
+        self._set_frame(df, date_col, dims, n_dated)
+        for c in self.dims:
+            self._positions[c] = _value_positions(self._codes[c], len(df[c].cat.categories))
+
+    def _set_frame(self, df, date_col, dims, n_dated):
+        self.df = df
+        self.date_col = date_col
+        self.dims = tuple(c for c in dims if c in df.columns)
+        self.dates = df[date_col].values
+        self.n_dated = n_dated
+        self._codes = {c: df[c].array.codes for c in self.dims}
+        self._lookup = {c: {v: i for i, v in enumerate(df[c].cat.categories)} for c in self.dims}
+        self._positions = {}
+
+    def extend(self, df, batch):
+        # Index over df + batch, where both come from align_batch(self.df, ...)
+        # and batch is sorted by date. When every new row is dated on or after
+        # the current last date (the usual case for new orders) the existing
+        # positions are kept and only the batch is indexed; otherwise the two
+        # sorted runs are merged and the index is rebuilt without re-parsing.
+        combined = pd.concat([df, batch], ignore_index=True)
+        new_dates = batch[self.date_col].values
+        in_order = (self.n_dated == len(self.df) and not np.isnat(new_dates).any()
+                    and (not self.n_dated or not len(new_dates) or new_dates[0] >= self.dates[self.n_dated - 1]))
+        if not in_order:
+            return FilterIndex(combined, self.date_col, self.dims)
+        index = FilterIndex.__new__(FilterIndex)
+        index._set_frame(combined, self.date_col, self.dims, len(combined))
+        for c in index.dims:
+            n_values = len(combined[c].cat.categories)
+            added = _value_positions(index._codes[c][len(df):], n_values, offset=len(df))
+            old = self._positions[c]
+            index._positions[c] = [np.concatenate([old[i], added[i]]) if i < len(old) else added[i]
+                                   for i in range(n_values)]
+        return index
+
+    def __len__(self):
+        return len(self.df)
+
+    def date_bounds(self, start_date, end_date):
+        # start_date/end_date are datetime.date (inclusive) or None
+        if start_date is None and end_date is None:
+            return 0, len(self.df)
+        dated = self.dates[:self.n_dated]
+        lo, hi = 0, self.n_dated
+        if start_date is not None:
+            lo = int(np.searchsorted(dated, np.datetime64(start_date, 'D'), side='left'))
+        if end_date is not None:
+            hi = int(np.searchsorted(dated, np.datetime64(end_date, 'D') + DAY, side='left'))
+        return lo, max(lo, hi)
+
+    def values(self, dim):
+        # the categories some row has, without scanning the column
+        categories = self.df[dim].cat.categories
+        return [categories[i] for i, rows in enumerate(self._positions[dim]) if len(rows)]
+
+    def value_codes(self, dim, values):
+        lookup = self._lookup[dim]
+        return [lookup[v] for v in values if v in lookup]
+
+    def positions(self, countries, categories, start_date, end_date):
+        # Returns a slice for a pure date range, else a sorted int array of row positions
+        lo, hi = self.date_bounds(start_date, end_date)
+        selected = []
+        for dim, values in (('Country', countries), ('Category', categories)):
+            if not values or dim not in self._positions:
+                continue
+            if isinstance(values, str):
+                values = [values]
+            codes = self.value_codes(dim, values)
+            size = sum(len(self._positions[dim][i]) for i in codes)
+            selected.append((size, dim, codes))
+        if not selected:
+            return slice(lo, hi)
+        # start from the most selective dimension, then probe the others by code
+        selected.sort(key=lambda s: s[0])
+        _, dim, codes = selected[0]
+        parts = [_clip(self._positions[dim][i], lo, hi) for i in codes]
+        if not parts:
+            return np.empty(0, dtype=np.intp)
+        pos = parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+        for _, dim, codes in selected[1:]:
+            # one spare slot so missing values (code -1) map to False
+            keep = np.zeros(len(self._positions[dim]) + 1, dtype=bool)
+            keep[codes] = True
+            pos = pos[keep[self._codes[dim][pos]]]
+        return pos
+
+    def take(self, sel):
+        if isinstance(sel, slice) and sel.start == 0 and sel.stop == len(self.df):
+            return self.df
+        return self.df.iloc[sel]
+
+
+def month_floor(values):
+    # datetime64 array -> month-start datetime64[ns]; NaT stays NaT
+    return values.astype('datetime64[M]').astype('datetime64[ns]')
+
+
+def _mix64(codes):
+    # splitmix64 finalizer: integer codes -> well-spread 64-bit hashes
+    h = codes.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def hll_registers(codes, precision, groups=None, n_groups=1):
+    # HyperLogLog registers (n_groups, 2**precision) of the user codes in each
+    # group: the top `precision` hash bits pick a register, which keeps the
+    # longest run of leading zeros (+1) seen in the next 32 bits
+    h = _mix64(codes)
+    reg = (h >> np.uint64(64 - precision)).astype(np.intp)
+    w = ((h >> np.uint64(32 - precision)) & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    rank = np.where(w > 0, 32 - np.floor(np.log2(np.maximum(w, 1))), 33).astype(np.uint8)
+    registers = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, (groups if groups is not None else 0, reg), rank)
+    return registers
+
+
+def hll_estimate(registers):
+    # Cardinality of one register row, with linear counting for small sets
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.ldexp(1.0, -registers.astype(np.int32)).sum()
+    zeros = int((registers == 0).sum())
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)
+    return int(round(estimate))
+
+
+class CustomerSketches:
+    # A mergeable HyperLogLog sketch of the users of every (Month, Country,
+    # Category) cell. Any filter's distinct-user count is then estimated by
+    # taking the register-wise max over the selected cells, at a standard error
+    # of about 1.04 / sqrt(2**precision) (1.6% at the default 12), instead of
+    # de-duplicating user codes.
+
+    def __init__(self, cells, registers, precision):
+        self.cells = cells
+        self.registers = registers
+        self.precision = precision
+
+    @classmethod
+    def build(cls, cell_users, precision=12):
+        keys = [c for c in cell_users.columns if c != 'user']
+        groups = cell_users.groupby(keys, observed=True, dropna=False, sort=False).ngroup().values
+        cells = cell_users.loc[~pd.Series(groups).duplicated().values, keys].reset_index(drop=True)
+        registers = hll_registers(cell_users['user'].values, precision, groups, len(cells))
+        return cls(cells, registers, precision)
+
+    def extend(self, df, added):
+        # Merge the sketches of newly seen (cell, user) rows; df supplies the extended categories
+        new = CustomerSketches.build(added, self.precision)
+        cells = pd.concat([_with_categories(self.cells, df), new.cells], ignore_index=True)
+        groups = cells.groupby(list(cells.columns), observed=True, dropna=False, sort=False).ngroup().values
+        registers = np.zeros((groups.max() + 1 if len(groups) else 0, 1 << self.precision), dtype=np.uint8)
+        np.maximum.at(registers, groups, np.concatenate([self.registers, new.registers]))
+        return CustomerSketches(cells[~pd.Series(groups).duplicated().values].reset_index(drop=True),
+                                registers, self.precision)
+
+
+def month_numbers(values):
+    # datetime64 array -> months since 1970-01 (int64); NaT -> Cohorts.NO_MONTH
+    months = values.astype('datetime64[M]').astype(np.int64)
+    return np.where(np.isnat(values), Cohorts.NO_MONTH, months)
+
+
+class Cohorts:
+    # What cohort retention is computed from: every customer's signup month
+    # and first purchase month (indexed by user code), and the revenue of each
+    # (user, month, country, category) the customer bought in, sorted by user
+    # then month. A filter selects a subset of those rows, and the distinct
+    # (user, month) pairs among them are the starts of runs, so a query costs
+    # O(selected rows) with no sort, no per-user loop and no row-level scan.
+
+    NO_MONTH = np.iinfo(np.int32).max
+
+    def __init__(self, users, months, countries, categories, revenue, signup, first):
+        self.users = users
+        self.months = months
+        self.countries = countries  # category code + 1, so 0 is a missing value
+        self.categories = categories
+        self.revenue = revenue
+        self.signup = signup
+        self.first = first
+
+    @classmethod
+    def build(cls, frame, months, user_codes, n_users, measure='TotalAmount', signup_col='SignUpDate', dims=('Country', 'Category')):
+        # frame's rows with their purchase month numbers and user codes
+        n = len(frame)
+        valid = (user_codes >= 0) & (months != cls.NO_MONTH)
+        users, months = user_codes[valid].astype(np.int64), months[valid]
+        codes = [frame[c].array.codes[valid].astype(np.int64) + 1 if c in frame.columns else np.zeros(len(users), np.int64)
+                 for c in dims]
+        revenue = np.nan_to_num(frame[measure].to_numpy(dtype=np.float64)[valid]) if measure in frame.columns else np.zeros(len(users))
+        signup = np.full(n_users, cls.NO_MONTH, dtype=np.int32)
+        if signup_col in frame.columns and n:
+            signed = month_numbers(frame[signup_col].values)
+            ok = (user_codes >= 0) & (signed != cls.NO_MONTH)
+            np.minimum.at(signup, user_codes[ok], signed[ok])
+        first = np.full(n_users, cls.NO_MONTH, dtype=np.int32)
+        np.minimum.at(first, users, months)
+        if not len(users):
+            empty = np.zeros(0, np.int32)
+            return cls(empty, empty, empty, empty, np.zeros(0), signup, first)
+        # one sortable key per row; equal keys are one (user, month, country, category)
+        m0 = months.min()
+        spans = [int(months.max() - m0) + 1, int(codes[0].max()) + 1, int(codes[1].max()) + 1]
+        key = ((users * spans[0] + (months - m0)) * spans[1] + codes[0]) * spans[2] + codes[1]
+        key, inverse = np.unique(key, return_inverse=True)
+        revenue = np.bincount(inverse, weights=revenue, minlength=len(key))
+        categories, key = key % spans[2], key // spans[2]
+        countries, key = key % spans[1], key // spans[1]
+        months, users = key % spans[0] + m0, key // spans[0]
+        # 24 bytes per row: int32 user, month and codes, float64 revenue
+        return cls(*(a.astype(np.int32) for a in (users, months, countries, categories)), revenue, signup, first)
+
+    def _keys(self, m0, spans):
+        users, months = self.users.astype(np.int64), self.months.astype(np.int64)
+        return ((users * spans[0] + (months - m0)) * spans[1] + self.countries) * spans[2] + self.categories
+
+    def extend(self, added):
+        # Merge the Cohorts of a batch (built with the extended n_users): the
+        # batch's rows are inserted into the sorted arrays, or add revenue to
+        # an existing row, in O(rows + batch rows)
+        signup = added.signup.copy()
+        first = added.first.copy()
+        signup[:len(self.signup)] = np.minimum(self.signup, signup[:len(self.signup)])
+        first[:len(self.first)] = np.minimum(self.first, first[:len(self.first)])
+        if not len(added.users):
+            return Cohorts(self.users, self.months, self.countries, self.categories, self.revenue, signup, first)
+        if not len(self.users):
+            return Cohorts(added.users, added.months, added.countries, added.categories, added.revenue, signup, first)
+        both = [np.concatenate([a, b]) for a, b in ((self.months, added.months), (self.countries, added.countries),
+                                                   (self.categories, added.categories))]
+        m0 = both[0].min()
+        spans = [int(both[0].max() - m0) + 1, int(both[1].max()) + 1, int(both[2].max()) + 1]
+        old, new = self._keys(m0, spans), added._keys(m0, spans)
+        pos = np.searchsorted(old, new)
+        found = pos < len(old)
+        found[found] = old[pos[found]] == new[found]
+        revenue = self.revenue.copy()
+        np.add.at(revenue, pos[found], added.revenue[found])
+        at = pos[~found]
+        arrays = [np.insert(a, at, b[~found]) for a, b in ((self.users, added.users), (self.months, added.months),
+                                                           (self.countries, added.countries),
+                                                           (self.categories, added.categories))]
+        return Cohorts(*arrays, np.insert(revenue, at, added.revenue[~found]), signup, first)
+
+    def select(self, months, country_codes, category_codes):
+        # rows within the inclusive (first, last) month numbers and the given category codes
+        mask = np.ones(len(self.users), dtype=bool)
+        if months is not None:
+            mask &= (self.months >= months[0]) & (self.months <= months[1])
+        for codes, values in ((self.countries, country_codes), (self.categories, category_codes)):
+            if values is not None:
+                keep = np.zeros(int(codes.max(initial=0)) + 2, dtype=bool)
+                keep[[c + 1 for c in values if c + 1 < len(keep)]] = True
+                mask &= keep[codes]
+        return mask
+
+
+class RollupCube:
+    # Monthly pre-aggregates (revenue sum and order count) built once from a
+    # FilterIndex, plus the distinct users of every (Month, Country, Category)
+    # cell. Whole months in a query are answered from the cube; partial months
+    # at either end of the date range are aggregated from their raw rows, which
+    # are contiguous slices of the date-sorted index. With sketch_precision set,
+    # the cells also get HyperLogLog sketches for approximate distinct counts.
+    # cohort_data holds what cohort retention is computed from (see Cohorts).
+
+    ROLLUPS = {
+        'sales': ('Country', 'Category', 'ProductName'),
+        'customers': ('Country', 'Category', 'Gender', 'ReferralSource'),
+    }
+    CELL_DIMS = ('Country', 'Category')
+
+    def __init__(self, index, measure='TotalAmount', user_col='UserID', parts=None, sketch_precision=None):
+        self.index = index
+        self.measure = measure
+        self.user_col = user_col
+        self.sketch_precision = sketch_precision
+        df = index.df
+        self.months = month_floor(index.dates)
+        users = df[user_col]
+        if isinstance(users.dtype, pd.CategoricalDtype):
+            self.user_codes, self.n_users = users.array.codes, len(users.cat.categories)
+        else:
+            self.user_codes, uniques = pd.factorize(users)
+            self.n_users = len(uniques)
+        if parts is not None:
+            self.rollups, self.cell_users, self.sketches, self.cohort_data = parts
+            return
+        self.rollups = {}
+        for name, dims in self.ROLLUPS.items():
+            dims = [c for c in dims if c in df.columns]
+            self.rollups[name] = (dims, self._aggregate(df, self.months, dims))
+        self.cell_users = self._cell_users(df, self.months, self.user_codes)
+        self.sketches = CustomerSketches.build(self.cell_users, sketch_precision) if sketch_precision else None
+        self.cohort_data = Cohorts.build(df, month_numbers(index.dates), self.user_codes, self.n_users, measure,
+                                         dims=self.CELL_DIMS)
+
+    def _cell_users(self, df, months, user_codes):
+        # distinct (Month, Country, Category, user code) rows
+        cell_dims = [c for c in self.CELL_DIMS if c in df.columns]
+        cells = pd.DataFrame({'Month': months, **{c: df[c].values for c in cell_dims}, 'user': user_codes})
+        return cells[cells['user'] >= 0].drop_duplicates(ignore_index=True)
+
+    def extend(self, index, batch):
+        # Cube for `index` (the result of FilterIndex.extend with `batch`): the
+        # batch is aggregated on its own and merged into the existing rollups,
+        # which costs O(batch rows + cube groups).
+        if not isinstance(index.df[self.user_col].dtype, pd.CategoricalDtype):
+            return RollupCube(index, self.measure, self.user_col, sketch_precision=self.sketch_precision)
+        months = month_floor(batch[index.date_col].values)
+        rollups = {}
+        for name, (dims, cube) in self.rollups.items():
+            merged = pd.concat([_with_categories(cube, index.df), self._aggregate(batch, months, dims)], ignore_index=True)
+            grouped = merged.groupby(['Month'] + dims, observed=True, dropna=False, sort=True)
+            rollups[name] = (dims, grouped[[self.measure, 'Orders']].sum().reset_index())
+        added = self._cell_users(batch, months, batch[self.user_col].array.codes)
+        cell_users = pd.concat([_with_categories(self.cell_users, index.df), added], ignore_index=True).drop_duplicates(ignore_index=True)
+        sketches = self.sketches.extend(index.df, added) if self.sketches is not None else None
+        batch_users = batch[self.user_col].array.codes
+        cohort_data = self.cohort_data.extend(Cohorts.build(
+            batch, month_numbers(batch[index.date_col].values), batch_users,
+            len(index.df[self.user_col].cat.categories), self.measure, dims=self.CELL_DIMS))
+        return RollupCube(index, self.measure, self.user_col, parts=(rollups, cell_users, sketches, cohort_data),
+                          sketch_precision=self.sketch_precision)
+
+    def _aggregate(self, df, months, dims):
+        keys = [pd.Series(months, index=df.index, name='Month')] + [df[c] for c in dims]
+        agg = df.groupby(keys, observed=True, dropna=False, sort=True)[self.measure].agg(['sum', 'size'])
+        return agg.reset_index().rename(columns={'sum': self.measure, 'size': 'Orders'})
+
+    def plan(self, start_date, end_date):
+        # Returns (months, edges): months is None (no whole months),
+        # (None, None) for everything including undated rows, or an inclusive
+        # (first, last) pair of month starts; edges are (start, end) date
+        # ranges to aggregate from raw rows.
+        if start_date is None and end_date is None:
+            return (None, None), []
+        dated = self.months[:self.index.n_dated]
+        if not len(dated):
+            return None, [(start_date, end_date)]
+        sd = np.datetime64(start_date, 'D') if start_date is not None else dated[0].astype('datetime64[D]')
+        if end_date is not None:
+            ed = np.datetime64(end_date, 'D')
+        else:
+            ed = (dated[-1].astype('datetime64[M]') + 1).astype('datetime64[D]') - 1
+        if sd > ed:
+            return None, []
+        m_sd, m_ed = sd.astype('datetime64[M]'), ed.astype('datetime64[M]')
+        lo = m_sd if sd == m_sd.astype('datetime64[D]') else m_sd + 1
+        hi = m_ed if ed == (m_ed + 1).astype('datetime64[D]') - 1 else m_ed - 1
+        if lo > hi:
+            return None, [(start_date, end_date)]
+        edges = []
+        if lo > m_sd:
+            edges.append((sd.astype(object), (lo.astype('datetime64[D]') - 1).astype(object)))
+        if hi < m_ed:
+            edges.append(((hi + 1).astype('datetime64[D]').astype(object), ed.astype(object)))
+        return (lo.astype('datetime64[ns]'), hi.astype('datetime64[ns]')), edges
+
+    def _mask(self, frame, months, countries, categories):
+        mask = np.ones(len(frame), dtype=bool)
+        if months[0] is not None:
+            m = frame['Month'].values
+            mask &= (m >= months[0]) & (m <= months[1])
+        if countries and 'Country' in frame.columns:
+            mask &= frame['Country'].isin(countries).values
+        if categories and 'Category' in frame.columns:
+            mask &= frame['Category'].isin(categories).values
+        return mask
+
+    def query(self, name, countries, categories, start_date, end_date):
+        # Aggregated rows of rollup `name` (Month, dims..., TotalAmount, Orders)
+        # for the filter state; edge months never overlap the cube months, so
+        # the parts are simply concatenated.
+        dims, cube = self.rollups[name]
+        months, edges = self.plan(start_date, end_date)
+        parts = []
+        if months is not None:
+            parts.append(cube[self._mask(cube, months, countries, categories)])
+        for a, b in edges:
+            sel = self.index.positions(countries, categories, a, b)
+            parts.append(self._aggregate(self.index.take(sel), self.months[sel], dims))
+        if not parts:
+            return cube.iloc[:0]
+        if len(parts) == 1:
+            return parts[0].reset_index(drop=True)
+        return pd.concat(parts, ignore_index=True)
+
+    def unique_customers(self, countries, categories, start_date, end_date, exact=True):
+        # exact=False estimates from the cell sketches (when built) and the edge rows
+        months, edges = self.plan(start_date, end_date)
+        if not exact and self.sketches is not None:
+            return self._estimate_customers(months, edges, countries, categories)
+        seen = np.zeros(self.n_users, dtype=bool)
+        if months is not None:
+            seen[self.cell_users['user'].values[self._mask(self.cell_users, months, countries, categories)]] = True
+        for a, b in edges:
+            codes = self.user_codes[self.index.positions(countries, categories, a, b)]
+            seen[codes[codes >= 0]] = True
+        return int(seen.sum())
+
+    def cohorts(self, countries, categories, start_date, end_date, basis='signup'):
+        # Retention for the filter state: per cohort month (of signup, or of
+        # the first purchase with basis='first_purchase') and months since, the
+        # customers who bought and their revenue. CohortCustomers counts the
+        # cohort's customers who bought at all within the filter.
+        co = self.cohort_data
+        months, edges = self.plan(start_date, end_date)
+        parts = []  # (users, months, revenue, first row of each distinct (user, month))
+        if months is not None:
+            month_range = None if months[0] is None else tuple(month_numbers(np.array(months)))
+            codes = [self.index.value_codes(dim, values) if values and dim in self.index.dims else None
+                     for dim, values in (('Country', countries), ('Category', categories))]
+            if month_range is None and codes == [None, None]:
+                u, m, r = co.users, co.months, co.revenue
+            else:
+                mask = co.select(month_range, *codes)
+                u, m, r = co.users[mask], co.months[mask], co.revenue[mask]
+            starts = np.ones(len(u), dtype=bool)
+            starts[1:] = (u[1:] != u[:-1]) | (m[1:] != m[:-1])
+            parts.append((u, m, r, starts))
+        measure = self.index.df[self.measure]
+        for a, b in edges:
+            # partial months from the raw rows; they never overlap the months above
+            sel = self.index.positions(countries, categories, a, b)
+            u, m = self.user_codes[sel].astype(np.int64), month_numbers(self.index.dates[sel])
+            ok = (u >= 0) & (m != Cohorts.NO_MONTH)
+            u, m, r = u[ok], m[ok], np.nan_to_num(measure.to_numpy(dtype=np.float64)[sel][ok])
+            starts = np.zeros(len(u), dtype=bool)
+            if len(u):
+                _, first_rows = np.unique(u * (int(m.max() - m.min()) + 1) + (m - m.min()), return_index=True)
+                starts[first_rows] = True
+            parts.append((u, m, r, starts))
+        cohort_of = co.signup if basis == 'signup' else co.first
+        if not parts:
+            parts = [(np.zeros(0, np.int32), np.zeros(0, np.int32), np.zeros(0), np.zeros(0, dtype=bool))]
+        u, m, r, starts = parts[0] if len(parts) == 1 else (np.concatenate(p) for p in zip(*parts))
+        c = cohort_of[np.asarray(u, dtype=np.intp)]
+        ok = m >= c  # drops unknown cohorts (NO_MONTH) and purchases dated before the signup
+        known = cohort_of[cohort_of != Cohorts.NO_MONTH]
+        if not ok.any() or not len(known):
+            return pd.DataFrame({'Cohort': pd.Series(dtype='datetime64[ns]'), 'MonthsSince': pd.Series(dtype=np.int64),
+                                 'Customers': pd.Series(dtype=np.int64), 'Revenue': pd.Series(dtype=np.float64),
+                                 'CohortCustomers': pd.Series(dtype=np.int64)})
+        # a (cohort, months since) grid over every known cohort; rows left out by
+        # `ok` go to one spare row past its end, which is cheaper than dropping them
+        c0, n_cohorts = int(known.min()), int(known.max() - known.min()) + 1
+        n_since = max(int(m.max()) - c0 + 1, 1)
+        n_cells = n_cohorts * n_since
+        cell = np.where(ok, c - c0, n_cohorts) * n_since + np.where(ok, m - c, 0)
+        starts &= ok
+        customers = np.bincount(cell, weights=starts, minlength=n_cells + 1)[:n_cells].astype(np.int64)
+        revenue = np.bincount(cell, weights=r, minlength=n_cells + 1)[:n_cells]
+        seen = np.zeros(len(cohort_of), dtype=bool)
+        seen[u[starts]] = True
+        sizes = np.bincount(cohort_of[seen] - c0, minlength=n_cohorts)
+        cells = np.flatnonzero(customers)
+        return pd.DataFrame({
+            'Cohort': (cells // n_since + c0).astype('datetime64[M]').astype('datetime64[ns]'),
+            'MonthsSince': cells % n_since,
+            'Customers': customers[cells],
+            'Revenue': revenue[cells],
+            'CohortCustomers': sizes[cells // n_since],
+        })
+
+    def _estimate_customers(self, months, edges, countries, categories):
+        sk = self.sketches
+        merged = np.zeros(1 << sk.precision, dtype=np.uint8)
+        if months is not None:
+            selected = sk.registers[self._mask(sk.cells, months, countries, categories)]
+            if len(selected):
+                merged = selected.max(axis=0)
+        for a, b in edges:
+            codes = self.user_codes[self.index.positions(countries, categories, a, b)]
+            if len(codes[codes >= 0]):
+                np.maximum(merged, hll_registers(codes[codes >= 0], sk.precision)[0], out=merged)
+        return hll_estimate(merged)
+
+
+class Dataset:
+    # The frame together with its filter index and rollup cube. Appending a
+    # batch builds a new Dataset, so a reader holding the old one keeps a
+    # consistent view while the new one is swapped in.
+
+    def __init__(self, index, cube, version=0):
+        self.index = index
+        self.cube = cube
+        self.version = version
+
+    @classmethod
+    def from_frame(cls, df, user_col='UserID', sketch_precision=None):
+        if user_col in df.columns and not isinstance(df[user_col].dtype, pd.CategoricalDtype):
+            df = df.assign(**{user_col: df[user_col].astype('category')})
+        index = FilterIndex(df)
+        return cls(index, RollupCube(index, user_col=user_col, sketch_precision=sketch_precision))
+
+    @property
+    def df(self):
+        return self.index.df
+
+    def append(self, batch):
+        df, batch = align_batch(self.df, batch)
+        index = self.index.extend(df, batch)
+        return Dataset(index, self.cube.extend(index, batch), self.version + 1)
@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# Usage: gunicorn -c gunicorn.conf.py app:server
+#
+# app.py loads the dataset, the filter index and the rollup cube at import
+# time. With preload_app that happens once in the master, and every forked
+# worker shares those pages copy-on-write instead of holding its own copy.
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7860')}"
+preload_app = True
+
+# One process per core for the pandas/plotly work, plus a few threads each so
+# a slow request (e.g. a large export) doesn't hold up the chart callbacks.
+workers = int(os.environ.get('WEB_CONCURRENCY', os.cpu_count() or 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+
+
+def pre_fork(server, worker):
+    # Move everything allocated during preload into the permanent GC generation.
+    # Otherwise the first collection in each worker writes to the headers of
+    # those objects and copies every page they live on.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Threads don't survive fork: each worker polls the ingest drop directory itself
+    import app
+    app.start_ingest_watcher()
@@ -0,0 +1,298 @@
+# metrics.py
+# In-process metrics for the dashboard, rendered in the Prometheus text format
+# by the /metrics route in app.py. Every callback is timed end to end and per
+# stage (filter, groupby, figure, serialize), along with the rows it read, the
+# points it plotted and the size of its response. Each worker process keeps its
+# own series, labelled with its pid.
+#
+# PROFILE_SLOW_MS=<ms> runs every callback request under cProfile and writes the
+# stats of those slower than that to PROFILE_DIR (read them with pstats or
+# snakeviz). Profiling slows requests down, so leave it off unless you need it.
+
+import base64
+import bisect
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+from flask import g, request
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(10 ** e for e in range(2, 9))
+ROWS_BUCKETS = tuple(10 ** e for e in range(0, 9))
+
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', './profiles')
+PROFILE_MAX_DUMPS = int(os.environ.get('PROFILE_MAX_DUMPS', '100'))
+
+_registry = []
+
+
+def _labels(names, values):
+    def escape(v):
+        return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{n}="{escape(v)}"' for n, v in zip(names, values))
+
+
+def _number(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = ('worker',) + tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> per-bucket counts (+Inf last), then the sum
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(label_values)
+            if s is None:
+                s = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def render(self, worker):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, s in series:
+            base = _labels(self.labels, (worker,) + label_values)
+            total = 0
+            for le, count in zip(self.buckets + ('+Inf',), s):
+                total += count
+                lines.append(f'{self.name}_bucket{{{base},le="{le}"}} {total}')
+            lines.append(f'{self.name}_sum{{{base}}} {_number(s[-1])}')
+            lines.append(f'{self.name}_count{{{base}}} {total}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = ('worker',) + tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self, worker):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        for label_values, value in series:
+            lines.append(f'{self.name}{{{_labels(self.labels, (worker,) + label_values)}}} {_number(value)}')
+        return lines
+
+
+class Collected:
+    # Values read at scrape time: collect() returns [(label values, value), ...]
+    def __init__(self, name, help, kind, labels, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = ('worker',) + tuple(labels)
+        self.collect = collect
+        _registry.append(self)
+
+    def render(self, worker):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for label_values, value in self.collect():
+            lines.append(f'{self.name}{{{_labels(self.labels, (worker,) + tuple(label_values))}}} {_number(value)}')
+        return lines
+
+
+def render():
+    worker = os.getpid()
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(worker))
+    return '\n'.join(lines) + '\n'
+
+
+request_seconds = Histogram('dashboard_request_seconds', 'HTTP request latency until the response is returned',
+                            ['endpoint'], LATENCY_BUCKETS)
+callback_seconds = Histogram('dashboard_callback_seconds', 'Callback latency, excluding serialization',
+                             ['callback'], LATENCY_BUCKETS)
+stage_seconds = Histogram('dashboard_stage_seconds', 'Time spent per callback stage',
+                          ['callback', 'stage'], LATENCY_BUCKETS)
+callback_rows = Histogram('dashboard_callback_rows', 'Rows read by a callback (in) and points it plotted (out)',
+                          ['callback', 'direction'], ROWS_BUCKETS)
+payload_bytes = Histogram('dashboard_payload_bytes', 'Size of callback responses',
+                          ['callback'], BYTES_BUCKETS)
+callback_errors = Counter('dashboard_callback_errors_total', 'Callbacks that raised',
+                          ['callback', 'error'])
+slow_profiles = Counter('dashboard_slow_profiles_total', 'cProfile dumps written for slow requests',
+                        ['callback'])
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _process_memory():
+    rss = _rss_bytes()
+    return [((), rss)] if rss is not None else []
+
+
+Collected('dashboard_process_resident_bytes', 'Resident memory of this worker', 'gauge', [], _process_memory)
+
+
+# Per-callback state lives on the thread: Dash runs the callback and serializes
+# its response in the thread that serves the request.
+_local = threading.local()
+
+
+class _Run:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.stages = {}
+        self.rows_in = 0
+
+
+@contextmanager
+def stage(name):
+    # Time spent in a stage; repeated stages within one callback add up
+    run = getattr(_local, 'run', None)
+    if run is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.stages[name] = run.stages.get(name, 0.0) + time.perf_counter() - t0
+
+
+def add_rows(n):
+    run = getattr(_local, 'run', None)
+    if run is not None:
+        run.rows_in += n
+
+
+def _array_size(v):
+    # plotly JSON keeps numeric arrays as {'dtype': 'f8', 'bdata': <base64>}
+    if isinstance(v, dict) and 'bdata' in v:
+        if 'shape' in v:
+            return int(np.prod([int(n) for n in str(v['shape']).split(',')]))
+        return len(base64.b64decode(v['bdata'])) // np.dtype(v['dtype']).itemsize
+    return int(np.size(v))
+
+
+def figure_points(result):
+    # Data points across the full figures a callback returns, as Figure
+    # objects or their JSON dicts (Patch and no_update outputs are skipped)
+    total = 0
+    for item in result if isinstance(result, (tuple, list)) else (result,):
+        if isinstance(item, dict):
+            traces = item.get('data')
+            if not isinstance(traces, list):
+                continue
+            get = dict.get
+        elif getattr(type(item), 'data', None) is None:
+            continue
+        else:
+            traces = item.data or ()
+            get = getattr
+        for trace in traces:
+            for attr in ('z', 'values', 'x', 'locations'):
+                v = get(trace, attr, None)
+                if v is not None:
+                    total += _array_size(v)
+                    break
+    return total
+
+
+def instrumented(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        run = _local.run = _Run(name)
+        t0 = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            callback_errors.inc(1, name, type(e).__name__)
+            raise
+        finally:
+            run.seconds = time.perf_counter() - t0
+            callback_seconds.observe(run.seconds, name)
+            for stage_name, seconds in run.stages.items():
+                stage_seconds.observe(seconds, name, stage_name)
+            callback_rows.observe(run.rows_in, name, 'in')
+        callback_rows.observe(figure_points(result), name, 'out')
+        return result
+    return wrapper
+
+
+def _dump_profile(profiler, name, elapsed_ms):
+    count = getattr(_dump_profile, 'count', 0)
+    if count >= PROFILE_MAX_DUMPS:
+        return
+    _dump_profile.count = count + 1
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{count:03d}-{name}-{elapsed_ms:.0f}ms.prof")
+    profiler.dump_stats(path)
+    slow_profiles.inc(1, name)
+
+
+def install(server):
+    # Request hooks: overall latency, serialization time and payload size of
+    # callback responses, and the optional slow-request profiler
+    @server.before_request
+    def _start_request():
+        _local.run = None
+        g.metrics_start = time.perf_counter()
+        if PROFILE_SLOW_MS > 0 and request.path.endswith('/_dash-update-component'):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:  # another profiler is active on this interpreter
+                return
+            g.metrics_profiler = profiler
+
+    @server.after_request
+    def _finish_request(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(elapsed, endpoint)
+        run, _local.run = getattr(_local, 'run', None), None
+        name = run.name if run is not None else 'none'
+        if run is not None:
+            stage_seconds.observe(max(elapsed - run.seconds, 0.0), name, 'serialize')
+            size = response.calculate_content_length()
+            if size is not None:
+                payload_bytes.observe(size, name)
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                _dump_profile(profiler, name, elapsed * 1000)
+        return response
+
+    @server.teardown_request
+    def _stop_profiler(exc):
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            profiler.disable()
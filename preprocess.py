@@ -0,0 +1,273 @@
+# preprocess.py
+# Usage: python preprocess.py [path/to/dataset.csv]
+#
+#        python preprocess.py path/to/dataset.csv --sqlite sales.db | --parquet sales.parquet
+#
+# Cleans and compacts the raw CSV once and writes a columnar snapshot next to
+# it (<name>.snapshot/: one .npy file per column plus manifest.json). The app
+# memory-maps the snapshot on boot instead of re-parsing the CSV whenever the
+# snapshot is newer than the CSV.
+#
+# --sqlite / --parquet instead convert the CSV, chunk by chunk, into a `sales`
+# table for the SQL backends (see backends.py); the CSV never has to fit in
+# memory as a whole.
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import numpy as np
+import pandas as pd
+from engine import casts_losslessly
+
+DEFAULT_CSV = './data/ecommerce_synthetic_dataset.csv'
+SNAPSHOT_VERSION = 2  # 2: compacted (no Date/Month columns, narrow numerics)
+CATEGORICAL_FILL = ['Category', 'Country', 'Gender', 'ProductName', 'DeviceType', 'ReferralSource', 'UserName']
+DATE_VIEWS = ('Date', 'Month')  # derived from PurchaseDate, see with_date_views()
+SUMMED_COLUMNS = ('TotalAmount',)  # stay float64: revenue is summed over millions of rows
+
+
+def clean_frame(df):
+    df.columns = [c.strip() for c in df.columns]
+
+    # Parse dates (handle dd-mm-YYYY safely)
+    for date_col in ['PurchaseDate', 'SignUpDate']:
+        if date_col in df.columns:
+            df[date_col] = pd.to_datetime(df[date_col], errors='coerce', dayfirst=True)
+
+    # Ensure numeric fields
+    if 'Quantity' not in df.columns:
+        df['Quantity'] = 1
+    if 'Price' not in df.columns:
+        df['Price'] = 0.0
+    if 'TotalAmount' not in df.columns:
+        try:
+            df['Price'] = pd.to_numeric(df['Price'], errors='coerce').fillna(0.0)
+            df['Quantity'] = pd.to_numeric(df['Quantity'], errors='coerce').fillna(1)
+        except Exception:
+            pass
+        df['TotalAmount'] = df['Price'] * df['Quantity']
+
+    # Fill categorical missing values
+    for c in CATEGORICAL_FILL:
+        if c in df.columns:
+            df[c] = df[c].fillna('Unknown')
+
+    # Add Date and Month fields from the already parsed PurchaseDate
+    if 'PurchaseDate' in df.columns and not df['PurchaseDate'].isna().all():
+        df['Date'] = df['PurchaseDate'].dt.normalize()
+        df['Month'] = df['PurchaseDate'].dt.to_period('M').dt.to_timestamp()
+    else:
+        today_ts = pd.to_datetime('today').normalize()
+        df['PurchaseDate'] = today_ts
+        df['Date'] = today_ts
+        df['Month'] = today_ts.to_period('M').to_timestamp()
+
+    # Ensure UserID exists
+    if 'UserID' not in df.columns and 'UserName' in df.columns:
+        df['UserID'] = df['UserName'].astype(str)
+    elif 'UserID' not in df.columns:
+        # fallback: create synthetic user ids
+        df['UserID'] = df.index.astype(str)
+
+    # Strings become categoricals; rows are stored in PurchaseDate order so the
+    # filter index can use them as-is
+    for c in df.columns:
+        if df[c].dtype.kind not in 'biufcmM' and not isinstance(df[c].dtype, pd.CategoricalDtype):
+            df[c] = df[c].astype('category')
+    df = df.sort_values('PurchaseDate', kind='stable', na_position='last')
+    return df.reset_index(drop=True)
+
+
+def with_date_views(df):
+    # Date (day) and Month (month start) columns derived from PurchaseDate, as
+    # clean_frame produces them; used where rows leave the app (export)
+    if 'PurchaseDate' not in df.columns or all(c in df.columns for c in DATE_VIEWS):
+        return df
+    dates = df['PurchaseDate'].values
+    return df.assign(Date=dates.astype('datetime64[D]').astype(dates.dtype),
+                     Month=dates.astype('datetime64[M]').astype(dates.dtype))
+
+
+def compact_frame(df):
+    # In-memory layout for the pandas backend: the Date/Month views are
+    # dropped (PurchaseDate is the one stored date), integers take the
+    # narrowest type that holds them and floats become float32 where every
+    # value keeps its decimal form. Summed measures stay float64.
+    if 'PurchaseDate' in df.columns:
+        df = df.drop(columns=[c for c in DATE_VIEWS if c in df.columns])
+    narrowed = {}
+    for c in df.columns:
+        values = df[c].values
+        if values.dtype.kind in 'iu' and len(values):
+            for dtype in (np.int8, np.int16, np.int32):
+                if casts_losslessly(values, dtype):
+                    narrowed[c] = values.astype(dtype)
+                    break
+        elif values.dtype == np.float64 and c not in SUMMED_COLUMNS and casts_losslessly(values, np.float32):
+            narrowed[c] = values.astype(np.float32)
+    return df.assign(**narrowed) if narrowed else df
+
+
+def frame_mb(df):
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def load_csv(csv_path):
+    return clean_frame(pd.read_csv(csv_path))
+
+
+def load_compact_csv(csv_path):
+    df = load_csv(csv_path)
+    before = frame_mb(df)
+    df = compact_frame(df)
+    print(f'Compacted {len(df):,} rows: {before:,.1f} MB -> {frame_mb(df):,.1f} MB')
+    return df
+
+
+def snapshot_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.snapshot'
+
+
+def write_snapshot(df, path):
+    tmp = f'{path}.tmp-{os.getpid()}'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = []
+    for i, c in enumerate(df.columns):
+        col = {'name': c, 'file': f'{i:03d}.npy'}
+        s = df[c]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            col['categories'] = s.cat.categories.tolist()
+            values = s.array.codes
+        else:
+            values = s.to_numpy()
+        np.save(os.path.join(tmp, col['file']), values, allow_pickle=False)
+        columns.append(col)
+    manifest = {'version': SNAPSHOT_VERSION, 'rows': len(df), 'columns': columns}
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, default=str)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    # Columns are memory-mapped read-only: pages are loaded lazily and shared
+    # through the page cache by every process that maps the same snapshot.
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+    data = {}
+    for col in manifest['columns']:
+        values = np.asarray(np.load(os.path.join(path, col['file']), mmap_mode='r', allow_pickle=False))
+        if 'categories' in col:
+            dtype = pd.CategoricalDtype(pd.Index(col['categories']))
+            values = pd.Categorical.from_codes(values, dtype=dtype, validate=False)
+        data[col['name']] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def snapshot_is_fresh(path, csv_path):
+    manifest = os.path.join(path, 'manifest.json')
+    try:
+        with open(manifest) as f:
+            if json.load(f).get('version') != SNAPSHOT_VERSION:
+                return False
+        snapshot_mtime = os.path.getmtime(manifest)
+    except (OSError, ValueError):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return snapshot_mtime >= os.path.getmtime(csv_path)
+
+
+def load_dataset(csv_path=DEFAULT_CSV, build_snapshot=True):
+    path = snapshot_path_for(csv_path)
+    if snapshot_is_fresh(path, csv_path):
+        return read_snapshot(path)
+    df = load_compact_csv(csv_path)
+    if build_snapshot:
+        try:
+            write_snapshot(df, path)
+        except OSError as e:
+            print(f'Could not write snapshot {path}: {e}')
+    return df
+
+
+def iter_clean_chunks(csv_path, chunk_rows):
+    # Cleaned chunks with plain string columns, ready for a SQL table
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        frame = clean_frame(chunk)
+        for c in frame.columns:
+            if isinstance(frame[c].dtype, pd.CategoricalDtype):
+                frame[c] = frame[c].astype(object)
+        yield frame
+
+
+def iso_text(values):
+    # datetime64 -> ISO strings (None for NaT) without a per-row strftime;
+    # plain dates unless a value carries a time of day
+    unit = 'D' if (values.dropna().dt.normalize() == values.dropna()).all() else 's'
+    text = values.to_numpy().astype(f'datetime64[{unit}]').astype(str)
+    return np.where(values.isna().to_numpy(), None, text)
+
+
+def write_sqlite(csv_path, db_path, chunk_rows=1_000_000):
+    tmp = f'{db_path}.tmp-{os.getpid()}'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    rows = 0
+    con = sqlite3.connect(tmp)
+    try:
+        for frame in iter_clean_chunks(csv_path, chunk_rows):
+            for c in frame.columns:
+                if frame[c].dtype.kind == 'M':
+                    frame[c] = iso_text(frame[c])
+            frame.to_sql('sales', con, if_exists='append', index=False, chunksize=100_000)
+            rows += len(frame)
+        for cols in (('Date',), ('Country', 'Date'), ('Category', 'Date')):
+            con.execute(f'CREATE INDEX IF NOT EXISTS ix_sales_{"_".join(cols).lower()} ON sales ({", ".join(cols)})')
+        con.execute('ANALYZE')
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp, db_path)
+    return rows
+
+
+def write_parquet(csv_path, path, chunk_rows=1_000_000):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    tmp = f'{path}.tmp-{os.getpid()}'
+    rows = 0
+    writer = None
+    try:
+        for frame in iter_clean_chunks(csv_path, chunk_rows):
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, table.schema, compression='zstd')
+            writer.write_table(table.cast(writer.schema))
+            rows += len(frame)
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp, path)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean the dataset CSV for the dashboard.')
+    parser.add_argument('csv', nargs='?', default=DEFAULT_CSV)
+    parser.add_argument('--sqlite', metavar='DB', help='write a SQLite database instead of the snapshot')
+    parser.add_argument('--parquet', metavar='FILE', help='write a Parquet file (for DuckDB) instead of the snapshot')
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    if args.sqlite or args.parquet:
+        for out, write in ((args.sqlite, write_sqlite), (args.parquet, write_parquet)):
+            if out:
+                print(f'Wrote {write(args.csv, out, args.chunk_rows):,} rows to {out}')
+    else:
+        out = snapshot_path_for(args.csv)
+        frame = load_compact_csv(args.csv)
+        write_snapshot(frame, out)
+        print(f'Wrote {len(frame):,} rows to {out}')
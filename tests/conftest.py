@@ -0,0 +1,52 @@
+# tests/conftest.py
+# Shared fixtures: a small synthetic dataset written with benchmarks/generate.py,
+# and helpers to compare results that may differ in row order and dtypes.
+
+import os
+import sys
+from datetime import date
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+import generate
+
+# (countries, categories, start, end): no filter, whole months only, partial
+# edge months, a single day and a filter nothing matches
+FILTER_STATES = [
+    ([], [], None, None),
+    (['India'], [], date(2022, 3, 1), date(2022, 8, 31)),
+    ([], ['Books', 'Home'], date(2022, 2, 14), date(2022, 11, 3)),
+    (['Japan', 'Germany'], ['Electronics'], date(2022, 5, 10), None),
+    ([], [], None, date(2022, 6, 20)),
+    (['France'], [], date(2022, 7, 4), date(2022, 7, 4)),
+    (['Nowhere'], [], None, None),
+]
+
+
+@pytest.fixture(scope='session')
+def sales_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp('data') / 'sales.csv'
+    return generate.write_csv(str(path), 6000, users=900, days=400, seed=7)
+
+
+def normalized(frame, keys):
+    # rows summed per key (parts of a result may split a group) in key order,
+    # with categoricals as plain values so stores of either kind compare
+    frame = frame.copy()
+    for c in frame.columns:
+        if isinstance(frame[c].dtype, pd.CategoricalDtype) or frame[c].dtype == object:
+            frame[c] = frame[c].astype(object).where(frame[c].notna(), None).astype(str)
+        elif frame[c].dtype.kind == 'M':
+            frame[c] = frame[c].astype('datetime64[ns]')
+        elif frame[c].dtype.kind in 'iuf':
+            frame[c] = frame[c].astype(np.float64)
+    frame = frame.groupby(keys, dropna=False, sort=True).sum().reset_index()
+    return frame[sorted(frame.columns)]
+
+
+def assert_same(left, right, keys):
+    pd.testing.assert_frame_equal(normalized(left, keys), normalized(right, keys), check_exact=False, rtol=1e-9)
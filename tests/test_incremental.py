@@ -0,0 +1,83 @@
+# tests/test_incremental.py
+# Dataset.append merges a batch into the index, rollups, customer cells and
+# cohorts instead of rebuilding them; the result must match a Dataset built
+# from all the rows at once.
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import FILTER_STATES, assert_same
+from engine import Dataset, RollupCube
+from preprocess import clean_frame, compact_frame
+
+
+def split(raw):
+    # Base: the earlier rows, without a set of users, one category and one
+    # country. The two batches hold the rest shuffled, so they bring new
+    # users, categories and countries and rows dated inside the base's span.
+    dates = pd.to_datetime(raw['PurchaseDate'], dayfirst=True)
+    held = ((dates >= dates.quantile(0.8)) | raw['UserID'].isin(raw['UserID'].unique()[:60])
+            | (raw['Category'] == 'Books') | (raw['Country'] == 'Japan'))
+    rest = raw[held].sample(frac=1, random_state=0)
+    first, second = rest.iloc[:len(rest) // 2].copy(), rest.iloc[len(rest) // 2:].copy()
+    # values the compacted base columns (int8 / float32) can't hold, so they widen
+    second.iloc[0, second.columns.get_loc('Quantity')] = 40000
+    second.iloc[1, second.columns.get_loc('Price')] = 123456789.5
+    return raw[~held], first, second
+
+
+@pytest.fixture(scope='module')
+def datasets(sales_csv):
+    raw = pd.read_csv(sales_csv)
+    base, first, second = split(raw)
+    appended = Dataset.from_frame(compact_frame(clean_frame(base.copy())))
+    appended = appended.append(clean_frame(first.copy())).append(clean_frame(second.copy()))
+    rebuilt = Dataset.from_frame(compact_frame(clean_frame(pd.concat([base, first, second], ignore_index=True))))
+    return appended, rebuilt
+
+
+def test_rows_and_dtypes(datasets):
+    appended, rebuilt = datasets
+    assert len(appended.df) == len(rebuilt.df)
+    assert appended.df['Quantity'].max() == 40000
+    assert appended.df['Price'].max() == 123456789.5
+    # widening keeps the decimals the narrowed values had
+    assert np.array_equal(np.sort(appended.df['Price'].to_numpy(np.float64)), np.sort(rebuilt.df['Price'].to_numpy(np.float64)))
+
+
+@pytest.mark.parametrize('dim', ['Country', 'Category'])
+def test_index_values(datasets, dim):
+    appended, rebuilt = datasets
+    assert sorted(appended.index.values(dim)) == sorted(rebuilt.index.values(dim))
+    assert sorted(rebuilt.index.values(dim)) == sorted(rebuilt.df[dim].dropna().unique())
+
+
+@pytest.mark.parametrize('state', FILTER_STATES)
+def test_index_positions(datasets, state):
+    appended, rebuilt = datasets
+    cols = ['PurchaseDate', 'UserID', 'Country', 'Category', 'ProductName', 'TotalAmount']
+    a = appended.index.take(appended.index.positions(*state))[cols]
+    b = rebuilt.index.take(rebuilt.index.positions(*state))[cols]
+    assert_same(a.assign(n=1), b.assign(n=1), cols[:-1])
+
+
+@pytest.mark.parametrize('name', list(RollupCube.ROLLUPS))
+@pytest.mark.parametrize('state', FILTER_STATES)
+def test_rollups(datasets, name, state):
+    appended, rebuilt = datasets
+    keys = ['Month'] + list(RollupCube.ROLLUPS[name])
+    assert_same(appended.cube.query(name, *state), rebuilt.cube.query(name, *state), keys)
+
+
+@pytest.mark.parametrize('state', FILTER_STATES)
+def test_unique_customers(datasets, state):
+    appended, rebuilt = datasets
+    assert appended.cube.unique_customers(*state) == rebuilt.cube.unique_customers(*state)
+
+
+@pytest.mark.parametrize('basis', ['signup', 'first_purchase'])
+@pytest.mark.parametrize('state', FILTER_STATES)
+def test_cohorts(datasets, state, basis):
+    appended, rebuilt = datasets
+    assert_same(appended.cube.cohorts(*state, basis=basis), rebuilt.cube.cohorts(*state, basis=basis),
+                ['Cohort', 'MonthsSince'])